@@ -0,0 +1,49 @@
+﻿"""ticket hot-path indexes
+
+Revision ID: 0002_ticket_indexes
+Revises: 0001_initial
+Create Date: 2026-10-18 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0002_ticket_indexes"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+OPEN_STATUS_PREDICATE = sa.text("status IN ('OPEN', 'IN_PROGRESS', 'WAITING_STORE')")
+
+INDEXES = [
+    # Keyset pagination order for the unfiltered admin list
+    ("ix_tickets_created_at_id", "tickets", [sa.text("created_at DESC"), sa.text("id DESC")], None),
+    ("ix_tickets_store_created_at", "tickets", ["store_id", sa.text("created_at DESC"), sa.text("id DESC")], None),
+    ("ix_tickets_status_priority_created_at", "tickets", ["status", "priority", sa.text("created_at DESC"), sa.text("id DESC")], None),
+    ("ix_tickets_category_impact_created_at", "tickets", ["category", "impact", sa.text("created_at DESC")], None),
+    ("ix_tickets_open_store_priority", "tickets", ["store_id", "priority", sa.text("created_at DESC")], OPEN_STATUS_PREDICATE),
+    ("ix_comments_ticket_id", "comments", ["ticket_id", "created_at"], None),
+    ("ix_attachments_ticket_id", "attachments", ["ticket_id", "created_at"], None),
+    ("ix_devices_store_id", "devices", ["store_id", sa.text("created_at DESC")], None),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps ticket writes flowing while the indexes build on a large table
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_where=where,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
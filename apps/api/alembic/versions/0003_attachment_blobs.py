@@ -0,0 +1,63 @@
+﻿"""content-addressed attachment blobs
+
+Revision ID: 0003_attachment_blobs
+Revises: 0002_ticket_indexes
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0003_attachment_blobs"
+down_revision = "0002_ticket_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(length=64), primary_key=True, nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("url", sa.String(length=500), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.create_index("ix_blobs_unreferenced", "blobs", ["sha256"], postgresql_where=sa.text("ref_count <= 0"))
+
+    op.add_column("attachments", sa.Column("blob_sha256", sa.String(length=64), sa.ForeignKey("blobs.sha256"), nullable=True))
+    op.create_index("ix_attachments_blob_sha256", "attachments", ["blob_sha256"])
+
+    # Triggers keep ref_count right for ORM deletes and for ON DELETE CASCADE from tickets and stores alike
+    op.execute(
+        """
+        CREATE FUNCTION attachments_blob_refcount() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.blob_sha256;
+                RETURN NEW;
+            END IF;
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.blob_sha256;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER attachments_blob_refcount
+        AFTER INSERT OR DELETE ON attachments
+        FOR EACH ROW
+        EXECUTE FUNCTION attachments_blob_refcount()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS attachments_blob_refcount ON attachments")
+    op.execute("DROP FUNCTION IF EXISTS attachments_blob_refcount()")
+    op.drop_index("ix_attachments_blob_sha256", table_name="attachments")
+    op.drop_column("attachments", "blob_sha256")
+    op.drop_index("ix_blobs_unreferenced", table_name="blobs")
+    op.drop_table("blobs")
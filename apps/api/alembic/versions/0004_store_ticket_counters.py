@@ -0,0 +1,126 @@
+﻿"""per-store ticket counters
+
+Revision ID: 0004_store_ticket_counters
+Revises: 0003_attachment_blobs
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0004_store_ticket_counters"
+down_revision = "0003_attachment_blobs"
+branch_labels = None
+depends_on = None
+
+OPEN_STATUS_PREDICATE = "status IN ('OPEN', 'IN_PROGRESS', 'WAITING_STORE')"
+
+# Signed ticket rows per trigger event, read from the statement's transition tables
+COUNTER_DELTAS = {
+    "INSERT": "SELECT store_id, status, priority, 1 AS delta FROM new_rows",
+    "UPDATE": "SELECT store_id, status, priority, 1 AS delta FROM new_rows UNION ALL SELECT store_id, status, priority, -1 FROM old_rows",
+    "DELETE": "SELECT store_id, status, priority, -1 AS delta FROM old_rows",
+}
+
+TRANSITION_TABLES = {
+    "INSERT": "NEW TABLE AS new_rows",
+    "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "OLD TABLE AS old_rows",
+}
+
+
+def _counter_function(event: str) -> str:
+    # Updates that touch neither status, priority nor store net out to zero and write nothing
+    changes = f"""
+                deltas AS (
+                    SELECT
+                        store_id,
+                        sum(delta) AS total_count,
+                        coalesce(sum(delta) FILTER (WHERE {OPEN_STATUS_PREDICATE}), 0) AS open_count,
+                        coalesce(sum(delta) FILTER (WHERE {OPEN_STATUS_PREDICATE} AND priority = 'P1'), 0) AS open_p1_count
+                    FROM ({COUNTER_DELTAS[event]}) AS changes
+                    GROUP BY store_id
+                    HAVING sum(delta) <> 0
+                        OR sum(delta) FILTER (WHERE {OPEN_STATUS_PREDICATE}) <> 0
+                        OR sum(delta) FILTER (WHERE {OPEN_STATUS_PREDICATE} AND priority = 'P1') <> 0
+                )"""
+    update = """
+                UPDATE store_ticket_counters AS counters SET
+                    total_count = counters.total_count + deltas.total_count,
+                    open_count = counters.open_count + deltas.open_count,
+                    open_p1_count = counters.open_p1_count + deltas.open_p1_count,
+                    updated_at = now()
+                FROM deltas
+                WHERE counters.store_id = deltas.store_id"""
+    if event == "DELETE":
+        # Only existing rows: a cascading store delete must not re-insert its counters
+        statement = f"WITH {changes}{update}"
+    else:
+        statement = f"""WITH {changes},
+                updated AS ({update}
+                RETURNING counters.store_id
+                )
+            INSERT INTO store_ticket_counters (store_id, total_count, open_count, open_p1_count)
+            SELECT store_id, total_count, open_count, open_p1_count FROM deltas
+            WHERE store_id NOT IN (SELECT store_id FROM updated)
+            ON CONFLICT (store_id) DO UPDATE SET
+                total_count = store_ticket_counters.total_count + excluded.total_count,
+                open_count = store_ticket_counters.open_count + excluded.open_count,
+                open_p1_count = store_ticket_counters.open_p1_count + excluded.open_p1_count,
+                updated_at = now()"""
+    return f"""
+        CREATE FUNCTION store_ticket_counters_{event.lower()}() RETURNS trigger AS $$
+        BEGIN
+            {statement};
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+
+
+def upgrade() -> None:
+    op.create_table(
+        "store_ticket_counters",
+        sa.Column("store_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("stores.id", ondelete="CASCADE"), primary_key=True, nullable=False),
+        sa.Column("total_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("open_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("open_p1_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+
+    # Statement-level triggers with transition tables: a bulk update adjusts each store once
+    for event in COUNTER_DELTAS:
+        op.execute(_counter_function(event))
+        op.execute(
+            f"""
+            CREATE TRIGGER store_ticket_counters_{event.lower()}
+            AFTER {event} ON tickets
+            REFERENCING {TRANSITION_TABLES[event]}
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION store_ticket_counters_{event.lower()}()
+            """
+        )
+
+    # Backfill under a write lock so no ticket change lands between the scan and the triggers
+    op.execute("LOCK TABLE tickets IN SHARE MODE")
+    op.execute(
+        f"""
+        INSERT INTO store_ticket_counters (store_id, total_count, open_count, open_p1_count)
+        SELECT
+            store_id,
+            count(*),
+            count(*) FILTER (WHERE {OPEN_STATUS_PREDICATE}),
+            count(*) FILTER (WHERE {OPEN_STATUS_PREDICATE} AND priority = 'P1')
+        FROM tickets
+        GROUP BY store_id
+        """
+    )
+
+
+def downgrade() -> None:
+    for event in reversed(list(COUNTER_DELTAS)):
+        op.execute(f"DROP TRIGGER IF EXISTS store_ticket_counters_{event.lower()} ON tickets")
+        op.execute(f"DROP FUNCTION IF EXISTS store_ticket_counters_{event.lower()}()")
+    op.drop_table("store_ticket_counters")
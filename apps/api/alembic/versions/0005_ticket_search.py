@@ -0,0 +1,53 @@
+﻿"""full-text search over tickets and comments
+
+Revision ID: 0005_ticket_search
+Revises: 0004_store_ticket_counters
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0005_ticket_search"
+down_revision = "0004_store_ticket_counters"
+branch_labels = None
+depends_on = None
+
+TICKET_SEARCH_VECTOR = (
+    "setweight(to_tsvector('hys_turkish'::regconfig, coalesce(title, '')), 'A')"
+    " || setweight(to_tsvector('hys_turkish'::regconfig, coalesce(description, '')), 'B')"
+    " || setweight(to_tsvector('hys_turkish'::regconfig, coalesce(resolution_note, '')), 'C')"
+)
+COMMENT_SEARCH_VECTOR = "to_tsvector('hys_turkish'::regconfig, body)"
+
+
+def upgrade() -> None:
+    # Turkish stemming on top of unaccent, so "koroglu" finds "Köroğlu" and "ILIK" finds "ılık"
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute("CREATE TEXT SEARCH CONFIGURATION hys_turkish (COPY = pg_catalog.turkish)")
+    op.execute("ALTER TEXT SEARCH CONFIGURATION hys_turkish ALTER MAPPING FOR hword, hword_part, word WITH unaccent, turkish_stem")
+
+    op.add_column("tickets", sa.Column("search_vector", postgresql.TSVECTOR(), sa.Computed(TICKET_SEARCH_VECTOR, persisted=True)))
+    op.add_column("comments", sa.Column("search_vector", postgresql.TSVECTOR(), sa.Computed(COMMENT_SEARCH_VECTOR, persisted=True)))
+
+    with op.get_context().autocommit_block():
+        for name, table in (("ix_tickets_search_vector", "tickets"), ("ix_comments_search_vector", "comments")):
+            op.create_index(
+                name,
+                table,
+                ["search_vector"],
+                postgresql_using="gin",
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table in (("ix_comments_search_vector", "comments"), ("ix_tickets_search_vector", "tickets")):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    op.drop_column("comments", "search_vector")
+    op.drop_column("tickets", "search_vector")
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS hys_turkish")
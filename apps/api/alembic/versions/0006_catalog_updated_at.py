@@ -0,0 +1,26 @@
+﻿"""updated_at on stores and devices
+
+Revision ID: 0006_catalog_updated_at
+Revises: 0005_ticket_search
+Create Date: 2026-10-18 13:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0006_catalog_updated_at"
+down_revision = "0005_ticket_search"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # now() is stable, so the default is stored once in the catalog instead of rewriting either table
+    for table in ("stores", "devices"):
+        op.add_column(table, sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False))
+
+
+def downgrade() -> None:
+    for table in ("devices", "stores"):
+        op.drop_column(table, "updated_at")
@@ -0,0 +1,41 @@
+﻿"""incident grouping of duplicate tickets
+
+Revision ID: 0007_ticket_incidents
+Revises: 0006_catalog_updated_at
+Create Date: 2026-10-18 14:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0007_ticket_incidents"
+down_revision = "0006_catalog_updated_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # similarity() scores candidates that the category/impact/created_at index already narrowed to the window
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column(
+        "tickets",
+        sa.Column("parent_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("tickets.id", ondelete="SET NULL"), nullable=True),
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tickets_parent_id",
+            "tickets",
+            ["parent_id"],
+            postgresql_where=sa.text("parent_id IS NOT NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tickets_parent_id", table_name="tickets", postgresql_concurrently=True, if_exists=True)
+    op.drop_column("tickets", "parent_id")
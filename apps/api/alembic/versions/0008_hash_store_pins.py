@@ -0,0 +1,43 @@
+﻿"""bcrypt-hash plaintext store PINs
+
+Revision ID: 0008_hash_store_pins
+Revises: 0007_ticket_incidents
+Create Date: 2026-10-18 15:00:00.000000
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from alembic import op
+import bcrypt
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0008_hash_store_pins"
+down_revision = "0007_ticket_incidents"
+branch_labels = None
+depends_on = None
+
+BCRYPT_ROUNDS = 12
+
+
+def _hash_pin(pin: str) -> str:
+    return bcrypt.hashpw(pin.encode()[:72], bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+
+
+def upgrade() -> None:
+    # Rows still holding a plaintext PIN; anything written later by an old worker is rehashed at its next login
+    bind = op.get_bind()
+    stores = bind.execute(sa.text("SELECT id, pin_hash FROM stores WHERE pin_hash !~ '^\\$2[aby]\\$'")).all()
+    # bcrypt releases the GIL, so the rounds run on every core
+    with ThreadPoolExecutor() as pool:
+        hashes = list(pool.map(_hash_pin, [pin for _, pin in stores]))
+    if stores:
+        bind.execute(
+            sa.text("UPDATE stores SET pin_hash = :pin_hash WHERE id = :id"),
+            [{"pin_hash": pin_hash, "id": store_id} for (store_id, _), pin_hash in zip(stores, hashes)],
+        )
+
+
+def downgrade() -> None:
+    # Hashes cannot be turned back into PINs; reset them with POST /admin/stores/{id}/reset-pin after downgrading
+    pass
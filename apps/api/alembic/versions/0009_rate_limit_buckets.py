@@ -0,0 +1,53 @@
+﻿"""shared rate limit buckets
+
+Revision ID: 0009_rate_limit_buckets
+Revises: 0008_hash_store_pins
+Create Date: 2026-10-18 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0009_rate_limit_buckets"
+down_revision = "0008_hash_store_pins"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Limiter state is disposable: UNLOGGED skips the WAL and a crash just resets every bucket
+    op.create_table(
+        "rate_limit_buckets",
+        sa.Column("key", sa.String(255), primary_key=True),
+        sa.Column("tat", sa.DateTime(timezone=True), nullable=False),
+        prefixes=["UNLOGGED"],
+    )
+    # GCRA: tat is when the bucket would be full again; an attempt is refused while it lies more than p_tolerance ahead
+    op.execute(
+        """
+        CREATE FUNCTION rate_limit_take(p_key text, p_interval interval, p_tolerance interval) RETURNS double precision AS $$
+        DECLARE
+            now_ts timestamptz := clock_timestamp();
+            current_tat timestamptz;
+        BEGIN
+            INSERT INTO rate_limit_buckets (key, tat) VALUES (p_key, now_ts) ON CONFLICT (key) DO NOTHING;
+            SELECT greatest(tat, now_ts) INTO current_tat FROM rate_limit_buckets WHERE key = p_key FOR UPDATE;
+            IF current_tat - now_ts > p_tolerance THEN
+                RETURN extract(epoch FROM current_tat - now_ts - p_tolerance);
+            END IF;
+            UPDATE rate_limit_buckets SET tat = current_tat + p_interval WHERE key = p_key;
+            -- Full buckets carry no state; sweep them now and then instead of on every call
+            IF random() < 0.01 THEN
+                DELETE FROM rate_limit_buckets WHERE tat < now_ts;
+            END IF;
+            RETURN 0;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP FUNCTION IF EXISTS rate_limit_take(text, interval, interval)")
+    op.drop_table("rate_limit_buckets")
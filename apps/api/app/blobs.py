@@ -0,0 +1,68 @@
+﻿import asyncio
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .models import Blob
+from .storage import SavedFile, StagedFile, Storage, create_storage
+
+logger = logging.getLogger(__name__)
+
+
+async def store_blob(db: AsyncSession, storage: Storage, staged: StagedFile) -> SavedFile:
+    # The blob row is committed before the bytes are placed, so any file under a hash always has a row
+    # and the collector frees it if the attachment insert never lands. The second upsert re-creates the
+    # row if the collector took it meanwhile and holds its lock until the caller commits, so the bytes
+    # cannot be deleted between placement and the attachment insert (the collector skips locked rows).
+    # ref_count itself is bumped by the attachments trigger when the attachment row is inserted.
+    try:
+        stmt = insert(Blob).values(sha256=staged.sha256, size=staged.size, url=storage.url_for(staged.sha256), ref_count=0)
+        stmt = stmt.on_conflict_do_update(index_elements=[Blob.sha256], set_={"url": stmt.excluded.url})
+        await db.execute(stmt)
+        await db.commit()
+        await db.execute(stmt)
+        return await storage.commit(staged)
+    except BaseException:
+        await storage.discard(staged)
+        raise
+
+
+async def collect_unreferenced_blobs(db: AsyncSession, storage: Storage, batch_size: int = 100) -> int:
+    blobs = (
+        await db.scalars(select(Blob).filter(Blob.ref_count <= 0).limit(batch_size).with_for_update(skip_locked=True))
+    ).all()
+    for blob in blobs:
+        await storage.delete(blob.sha256)
+        await db.delete(blob)
+    await db.commit()
+    return len(blobs)
+
+
+async def run_blob_collector(session_factory, storage: Storage) -> None:
+    while True:
+        await asyncio.sleep(settings.blob_gc_interval_seconds)
+        try:
+            async with session_factory() as db:
+                while await collect_unreferenced_blobs(db, storage):
+                    pass
+        except Exception:
+            logger.exception("Blob collection failed")
+
+
+async def main() -> None:
+    from .db import AsyncSessionLocal, async_engine
+
+    storage = create_storage()
+    total = 0
+    async with AsyncSessionLocal() as db:
+        while freed := await collect_unreferenced_blobs(db, storage):
+            total += freed
+    await async_engine.dispose()
+    print(f"Freed {total} unreferenced blobs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+﻿import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import schemas
+from .config import settings
+from .models import Device, Store
+
+CHANNEL = "catalog_changes"
+
+
+class TTLCache:
+    # Per-worker read-through cache; the generation guard stops a load that raced an invalidation from being stored
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, tuple[float, Any]] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        generation = self._generation
+        value = await loader()
+        if self.ttl_seconds > 0 and generation == self._generation:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        self._generation += 1
+        self.invalidations += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+catalog_cache = TTLCache(settings.catalog_cache_ttl_seconds)
+
+
+def _store_key(store_id: Any) -> str | None:
+    # One key per store whatever the spelling of the id, or invalidation would miss entries
+    try:
+        return str(UUID(str(store_id)))
+    except ValueError:
+        return None
+
+
+async def get_store(db: AsyncSession, store_id: Any) -> schemas.StoreOut | None:
+    key = _store_key(store_id)
+    if key is None:
+        return None
+
+    async def load():
+        store = await db.get(Store, key)
+        return schemas.StoreOut.model_validate(store) if store else None
+
+    return await catalog_cache.get_or_load(("store", key), load)
+
+
+async def get_store_devices(db: AsyncSession, store_id: Any) -> List[schemas.DeviceOut]:
+    key = _store_key(store_id)
+
+    async def load():
+        devices = await db.scalars(select(Device).filter(Device.store_id == key).order_by(Device.created_at.desc()))
+        return [schemas.DeviceOut.model_validate(device) for device in devices]
+
+    return await catalog_cache.get_or_load(("devices", key), load)
+
+
+def invalidate_store(store_id: Any) -> None:
+    key = _store_key(store_id)
+    catalog_cache.invalidate(("store", key), ("devices", key))
+
+
+def on_catalog_notify(connection, pid: int, channel: str, payload: str) -> None:
+    invalidate_store(json.loads(payload)["store_id"])
+
+
+async def commit_catalog_change(db: AsyncSession, store_id: Any) -> None:
+    # NOTIFY reaches the other workers (and this one) only after commit; the local drop closes that gap here
+    await db.execute(select(func.pg_notify(CHANNEL, json.dumps({"store_id": str(store_id)}))))
+    await db.commit()
+    invalidate_store(store_id)
@@ -0,0 +1,27 @@
+﻿import hashlib
+from typing import Any
+
+from fastapi import Response, status
+
+# Cached copies must be revalidated on every use; a matching ETag turns that into a bodyless 304
+REVALIDATE = "private, no-cache"
+
+
+def weak_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified(if_none_match: str | None, etag: str, response: Response) -> Response | None:
+    # Returns the 304 to send, or None after tagging the full response that the caller goes on to build
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE}
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
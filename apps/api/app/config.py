@@ -6,19 +6,51 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str
+    async_database_url: Union[str, None] = None
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_slow_checkout_ms: int = 500
+    slow_query_ms: int = 500
+    request_query_budget: int = 50
+    query_budget_strict: bool = False
     admin_password: str
     jwt_secret: str
     jwt_expires_days: int = 7
+    auth_token_cache_size: int = 4096
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    login_rate_limit_backend: str = "memory"
+    login_ip_attempts: int = 20
+    login_account_attempts: int = 10
+    login_attempt_window_seconds: int = 300
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     allowed_origins: List[str] = ["http://localhost:3000"]
     file_storage_backend: str = "local"
     upload_dir: str = "/app/uploads"
+    max_upload_bytes: int = 250 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+    blob_gc_interval_seconds: int = 3600
+    accel_redirect_prefix: Union[str, None] = None
+    report_timezone: str = "Europe/Istanbul"
+    export_batch_size: int = 1000
+    catalog_cache_ttl_seconds: int = 300
+    incident_window_minutes: int = 30
+    incident_similarity_threshold: float = 0.4
+    event_queue_size: int = 100
+    event_heartbeat_seconds: int = 15
+    event_reconnect_seconds: int = 5
     s3_endpoint: Union[str, None] = None
     s3_bucket: Union[str, None] = None
     s3_region: Union[str, None] = None
     s3_access_key: Union[str, None] = None
     s3_secret_key: Union[str, None] = None
+    s3_multipart_chunk_size: int = 8 * 1024 * 1024
+    s3_max_pool_connections: int = 20
+    s3_presign_expires: int = 3600
 
     @field_validator("allowed_origins", mode="before")
     @classmethod
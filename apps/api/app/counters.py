@@ -0,0 +1,58 @@
+﻿import asyncio
+
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .enums import OPEN_STATUSES, Priority
+from .models import Store, StoreTicketCounter, Ticket
+
+
+async def rebuild_store_counters(db: AsyncSession) -> tuple[int, int]:
+    # SHARE blocks ticket writes (not reads) until commit, so no trigger delta lands between the scan and the upsert
+    await db.execute(text("LOCK TABLE tickets IN SHARE MODE"))
+    is_open = Ticket.status.in_(OPEN_STATUSES)
+    actual = (
+        select(
+            Store.id.label("store_id"),
+            func.count(Ticket.id).label("total_count"),
+            func.count(Ticket.id).filter(is_open).label("open_count"),
+            func.count(Ticket.id).filter(is_open, Ticket.priority == Priority.P1).label("open_p1_count"),
+        )
+        .outerjoin(Ticket, Ticket.store_id == Store.id)
+        .group_by(Store.id)
+    )
+    stmt = insert(StoreTicketCounter).from_select(["store_id", "total_count", "open_count", "open_p1_count"], actual)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StoreTicketCounter.store_id],
+        set_={
+            "total_count": stmt.excluded.total_count,
+            "open_count": stmt.excluded.open_count,
+            "open_p1_count": stmt.excluded.open_p1_count,
+            "updated_at": func.now(),
+        },
+        # Only drifted (or missing) rows are written and returned
+        where=(
+            (StoreTicketCounter.total_count != stmt.excluded.total_count)
+            | (StoreTicketCounter.open_count != stmt.excluded.open_count)
+            | (StoreTicketCounter.open_p1_count != stmt.excluded.open_p1_count)
+        ),
+    )
+    # xmax is 0 only on freshly inserted rows: a missing counter row is not drift, so the two are reported apart
+    inserted = (await db.scalars(stmt.returning(literal_column("xmax = 0")))).all()
+    await db.commit()
+    created = sum(inserted)
+    return created, len(inserted) - created
+
+
+async def main() -> None:
+    from .db import AsyncSessionLocal, async_engine
+
+    async with AsyncSessionLocal() as db:
+        created, corrected = await rebuild_store_counters(db)
+    await async_engine.dispose()
+    print(f"Rebuilt ticket counters, {corrected} stores corrected, {created} missing rows created")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,41 @@
 ﻿from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from .config import settings
+from .pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, pool_options
 
-engine = create_engine(settings.database_url, future=True)
+# Sync engine: Alembic, seed and the remaining sync routes
+engine = create_engine(settings.database_url, future=True, poolclass=InstrumentedQueuePool, **pool_options())
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
 
+def _async_database_url() -> str:
+    if settings.async_database_url:
+        return settings.async_database_url
+    return make_url(settings.database_url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def listen_dsn() -> str:
+    # Plain libpq-style DSN for the dedicated asyncpg LISTEN connection
+    return make_url(_async_database_url()).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+# Async engine: routers that opt in through get_async_db don't hold a threadpool worker while waiting on Postgres
+async_engine = create_async_engine(_async_database_url(), poolclass=InstrumentedAsyncQueuePool, **pool_options())
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
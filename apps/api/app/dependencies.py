@@ -1,9 +1,10 @@
 ﻿from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .db import get_db
+from . import schemas
+from .catalog import get_store
+from .db import get_async_db
 from .enums import UserRole
-from .models import Store
 from .security import decode_token, ensure_role, oauth2_scheme, require_token
 
 
@@ -14,14 +15,14 @@ def get_current_admin(credentials=Depends(oauth2_scheme)):
     return payload
 
 
-def get_current_store(credentials=Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Store:
+async def get_current_store(credentials=Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> schemas.StoreOut:
     token = require_token(credentials)
     payload = decode_token(token)
     ensure_role(payload, UserRole.STORE)
     store_id = payload.get("store_id")
     if not store_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    store = db.get(Store, store_id)
+    store = await get_store(db, store_id)
     if not store or not store.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Store inactive or not found")
     return store
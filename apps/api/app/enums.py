@@ -33,6 +33,9 @@ class Status(str, enum.Enum):
     CLOSED = "CLOSED"
 
 
+OPEN_STATUSES = (Status.OPEN, Status.IN_PROGRESS, Status.WAITING_STORE)
+
+
 class CloseCode(str, enum.Enum):
     FIXED = "FIXED"
     USER_ERROR = "USER_ERROR"
@@ -50,3 +53,11 @@ class AuthorRole(str, enum.Enum):
 class UserRole(str, enum.Enum):
     ADMIN = "admin"
     STORE = "store"
+
+
+class TicketEventType(str, enum.Enum):
+    TICKET_CREATED = "ticket.created"
+    TICKET_UPDATED = "ticket.updated"
+    COMMENT_CREATED = "comment.created"
+    ATTACHMENT_CREATED = "attachment.created"
+    RESYNC = "resync"
@@ -0,0 +1,118 @@
+﻿import asyncio
+import json
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Set, Tuple
+
+import asyncpg
+from fastapi import Request
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import catalog
+from .config import settings
+from .enums import TicketEventType
+from .models import Ticket
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "ticket_events"
+
+
+def _event_payload(event_type: TicketEventType, ticket: Any, data: Dict[str, Any]) -> str:
+    payload = {
+        "id": uuid.uuid4().hex,
+        "type": event_type.value,
+        "ticket_id": str(ticket.id),
+        "store_id": str(ticket.store_id),
+        "status": ticket.status.value,
+        "priority": ticket.priority.value,
+        **data,
+    }
+    return json.dumps(payload, default=str)
+
+
+async def publish_event(db: AsyncSession, event_type: TicketEventType, ticket: Ticket, **data: Any) -> None:
+    # NOTIFY is transactional: listeners only see the event once the caller commits
+    await db.execute(select(func.pg_notify(CHANNEL, _event_payload(event_type, ticket, data))))
+
+
+async def publish_events(db: AsyncSession, event_type: TicketEventType, tickets: Iterable[Any], *fields: str) -> None:
+    # One round trip for a whole batch; each ticket still gets its own notification, carrying its own values of fields
+    payloads = [_event_payload(event_type, ticket, {field: getattr(ticket, field) for field in fields}) for ticket in tickets]
+    if payloads:
+        payload = func.unnest(bindparam("payloads", payloads, type_=ARRAY(Text))).column_valued("payload")
+        await db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+class EventBroker:
+    # One LISTEN connection per worker fans NOTIFY payloads out to that worker's SSE subscribers
+    # and carries catalog cache invalidations
+    def __init__(self, dsn: str, queue_size: int = settings.event_queue_size):
+        self.dsn = dsn
+        self.queue_size = queue_size
+        self._subscribers: Set[Tuple[asyncio.Queue, str | None]] = set()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _listen(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                await connection.add_listener(catalog.CHANNEL, catalog.on_catalog_notify)
+                # Anything published while we were disconnected is gone; tell clients to refetch
+                self._broadcast({"type": TicketEventType.RESYNC.value})
+                catalog.catalog_cache.clear()
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ticket event listener failed")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(settings.event_reconnect_seconds)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._broadcast(json.loads(payload))
+
+    def _broadcast(self, event: Dict[str, Any]) -> None:
+        for queue, store_id in list(self._subscribers):
+            if store_id is not None and event.get("store_id") not in (None, store_id):
+                continue
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and make it refetch instead of blocking the fan-out
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": TicketEventType.RESYNC.value})
+
+    @asynccontextmanager
+    async def subscribe(self, store_id: str | None) -> AsyncIterator[asyncio.Queue]:
+        subscriber = (asyncio.Queue(maxsize=self.queue_size), store_id)
+        self._subscribers.add(subscriber)
+        try:
+            yield subscriber[0]
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+def get_event_broker(request: Request) -> EventBroker:
+    return request.app.state.events
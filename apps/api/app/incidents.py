@@ -0,0 +1,28 @@
+﻿from datetime import timedelta
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .enums import OPEN_STATUSES, Category, Impact
+from .models import Ticket
+
+
+async def find_incident_parent(db: AsyncSession, category: Category, impact: Impact, title: str, description: str) -> UUID | None:
+    # ix_tickets_category_impact_created_at narrows the scan to the window, so similarity() only scores a handful of rows
+    score = func.greatest(func.similarity(Ticket.title, title), func.similarity(Ticket.description, description))
+    return await db.scalar(
+        select(Ticket.id)
+        .filter(
+            Ticket.category == category,
+            Ticket.impact == impact,
+            Ticket.created_at >= func.now() - timedelta(minutes=settings.incident_window_minutes),
+            Ticket.status.in_(OPEN_STATUSES),
+            # Clusters stay one level deep: new tickets only attach to roots
+            Ticket.parent_id.is_(None),
+            score >= settings.incident_similarity_threshold,
+        )
+        .order_by(score.desc(), Ticket.created_at)
+        .limit(1)
+    )
@@ -1,14 +1,44 @@
-﻿import os
+﻿import asyncio
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 
+from .blobs import run_blob_collector
+from .catalog import catalog_cache
 from .config import settings
-from .routers import auth, devices, stores, tickets
+from .db import AsyncSessionLocal, async_engine, engine, listen_dsn
+from .events import EventBroker
+from . import metrics
+from .middleware import MaxBodySizeMiddleware, MetricsMiddleware
+from .pool import pool_snapshot
+from .routers import auth, devices, events, stores, tickets
+from .security import token_cache
+from .storage import create_storage
 
-app = FastAPI(title="HYS IT Ticket API")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.storage = create_storage()
+    app.state.events = EventBroker(listen_dsn())
+    await app.state.events.start()
+    collector = None
+    if settings.blob_gc_interval_seconds > 0:
+        collector = asyncio.create_task(run_blob_collector(AsyncSessionLocal, app.state.storage))
+    yield
+    if collector is not None:
+        collector.cancel()
+    await app.state.events.stop()
+    await async_engine.dispose()
+
+
+metrics.instrument_engine(async_engine.sync_engine, "async")
+metrics.instrument_engine(engine, "sync")
+
+app = FastAPI(title="HYS IT Ticket API", lifespan=lifespan)
+
+app.add_middleware(MaxBodySizeMiddleware, max_body_size=settings.max_upload_bytes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origins,
@@ -16,12 +46,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so rejected uploads and CORS preflights are counted and timed too
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(stores.router)
 app.include_router(devices.router)
 app.include_router(devices.public_router)
 app.include_router(tickets.router)
+app.include_router(events.router)
 
 
 @app.get("/health")
@@ -29,6 +62,19 @@ def health_check():
     return {"status": "ok"}
 
 
-if settings.file_storage_backend == "local":
-    os.makedirs(settings.upload_dir, exist_ok=True)
-    app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
+@app.get("/health/db-pool")
+def db_pool_stats():
+    return {
+        "async": pool_snapshot(async_engine.sync_engine.pool),
+        "sync": pool_snapshot(engine.pool),
+    }
+
+
+@app.get("/health/cache")
+def cache_stats():
+    return {"catalog": catalog_cache.as_dict(), "tokens": token_cache.as_dict()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,199 @@
+﻿import bisect
+import logging
+import reprlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1.0) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: one count per bucket (non-cumulative until rendered), then sum and count
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        for labels, series in values:
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = 'le="{}"'.format(bound if bound == "+Inf" else _format_value(bound))
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {_format_value(series[-1])}"
+
+
+http_requests_total = Counter("http_requests_total", "HTTP responses by route and status code", ("method", "route", "status"))
+http_requests_in_progress = Gauge("http_requests_in_progress", "HTTP requests currently being served", ("method",))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "Time to the end of the response body", ("method", "route"))
+http_response_size_bytes = Histogram("http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS)
+http_request_db_queries = Histogram("http_request_db_queries", "SQL statements executed per request", ("method", "route"), QUERY_COUNT_BUCKETS)
+http_request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL statements per request", ("method", "route"))
+db_queries_total = Counter("db_queries_total", "SQL statements executed, requests and background tasks alike", ("engine",))
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "Time per SQL statement", ("engine",))
+
+METRICS = (
+    http_requests_total,
+    http_requests_in_progress,
+    http_request_duration_seconds,
+    http_response_size_bytes,
+    http_request_db_queries,
+    http_request_db_seconds,
+    db_queries_total,
+    db_query_duration_seconds,
+)
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class RequestStats:
+    __slots__ = ("request_id", "method", "scope", "queries", "db_seconds")
+
+    def __init__(self, request_id: str, method: str, scope: Dict[str, Any]):
+        self.request_id = request_id
+        self.method = method
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope before the endpoint runs
+        return getattr(self.scope.get("route"), "path", "<unmatched>")
+
+    def describe(self) -> str:
+        return f"{self.request_id} {self.method} {self.route}"
+
+
+# Set by MetricsMiddleware; the async engine's greenlets and run_in_threadpool both carry it to the cursor events
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+# Bulk updates bind whole id lists; keep the log line readable
+_params_repr = reprlib.Repr()
+_params_repr.maxstring = _params_repr.maxother = 120
+_params_repr.maxlist = _params_repr.maxtuple = _params_repr.maxdict = 20
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_queries_total.inc((name,))
+        db_query_duration_seconds.observe((name,), elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        if settings.slow_query_ms > 0 and elapsed * 1000 >= settings.slow_query_ms:
+            logger.warning(
+                "Slow query (%.1f ms) [%s]: %s params=%s",
+                elapsed * 1000,
+                stats.describe() if stats is not None else "no request",
+                " ".join(statement.split()),
+                _params_repr.repr(parameters),
+            )
+
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute; drop its start time so the stack stays aligned
+        if context.connection is not None and context.cursor is not None:
+            started = context.connection.info.get("query_started")
+            if started:
+                started.pop()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def check_query_budget(stats: RequestStats) -> None:
+    budget = settings.request_query_budget
+    if budget <= 0 or stats.queries <= budget:
+        return
+    message = f"Query budget exceeded ({stats.queries} > {budget} statements) [{stats.describe()}]"
+    # Strict mode is for test runs: the error reaches the test client instead of a log line nobody reads
+    if settings.query_budget_strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
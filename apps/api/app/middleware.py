@@ -0,0 +1,84 @@
+﻿import re
+import time
+import uuid
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import (
+    RequestStats,
+    check_query_budget,
+    current_request,
+    http_request_db_queries,
+    http_request_db_seconds,
+    http_request_duration_seconds,
+    http_requests_in_progress,
+    http_requests_total,
+    http_response_size_bytes,
+)
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+# Ids from a proxy or client are kept only if they are safe to echo into headers and logs
+REQUEST_ID_PATTERN = re.compile(rb"[A-Za-z0-9._-]{1,64}")
+
+
+class MaxBodySizeMiddleware:
+    # Rejects oversized uploads from the Content-Length header, before the body is read or spooled
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > self.max_body_size:
+                    response = JSONResponse({"detail": "File too large"}, status_code=413)
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+class MetricsMiddleware:
+    # Labels by route template (scope["route"], set by the router), never the raw path, so label cardinality stays bounded.
+    # Also tags each request with an id (X-Request-ID, echoed back) that slow-query and query-budget logs refer to
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        request_id = next((value for name, value in scope["headers"] if name == b"x-request-id"), b"")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex.encode()
+        status_code = 500
+        size = 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id)]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        stats = RequestStats(request_id.decode(), method, scope)
+        token = current_request.set(stats)
+        http_requests_in_progress.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec((method,))
+            current_request.reset(token)
+            labels = (method, stats.route)
+            http_requests_total.inc((*labels, str(status_code)))
+            http_request_duration_seconds.observe(labels, elapsed)
+            http_response_size_bytes.observe(labels, size)
+            http_request_db_queries.observe(labels, stats.queries)
+            http_request_db_seconds.observe(labels, stats.db_seconds)
+        check_query_budget(stats)
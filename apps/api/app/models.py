@@ -1,12 +1,15 @@
 ﻿import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Enum, ForeignKey, String, Text, func, Integer
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Boolean, Column, Computed, DateTime, Enum, ForeignKey, Index, String, Text, func, Integer
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 
 from .db import Base
-from .enums import AuthorRole, Category, CloseCode, Impact, Priority, Status
+from .enums import OPEN_STATUSES, AuthorRole, Category, CloseCode, Impact, Priority, Status
+
+# Turkish stemming over unaccent (0005_ticket_search); queries must use the same configuration
+SEARCH_CONFIG = "hys_turkish"
 
 
 class Store(Base):
@@ -18,11 +21,23 @@ class Store(Base):
     pin_hash = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
     devices = relationship("Device", back_populates="store", cascade="all, delete-orphan")
     tickets = relationship("Ticket", back_populates="store", cascade="all, delete-orphan")
 
 
+class StoreTicketCounter(Base):
+    # Maintained by statement-level triggers on tickets (0004_store_ticket_counters); rebuilt by app.counters
+    __tablename__ = "store_ticket_counters"
+
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), primary_key=True)
+    total_count = Column(Integer, nullable=False, default=0, server_default="0")
+    open_count = Column(Integer, nullable=False, default=0, server_default="0")
+    open_p1_count = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class Device(Base):
     __tablename__ = "devices"
 
@@ -32,10 +47,13 @@ class Device(Base):
     type = Column(String(100), nullable=False)
     serial = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
     store = relationship("Store", back_populates="devices")
     tickets = relationship("Ticket", back_populates="device")
 
+    __table_args__ = (Index("ix_devices_store_id", "store_id", created_at.desc()),)
+
 
 class Ticket(Base):
     __tablename__ = "tickets"
@@ -56,12 +74,40 @@ class Ticket(Base):
     closed_at = Column(DateTime(timezone=True), nullable=True)
     close_code = Column(Enum(CloseCode), nullable=True)
     resolution_note = Column(Text, nullable=True)
+    parent_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id", ondelete="SET NULL"), nullable=True)
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(title, '')), 'A')"
+                f" || setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(description, '')), 'B')"
+                f" || setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(resolution_note, '')), 'C')",
+                persisted=True,
+            ),
+        )
+    )
 
     store = relationship("Store", back_populates="tickets")
     device = relationship("Device", back_populates="tickets")
     comments = relationship("Comment", back_populates="ticket", cascade="all, delete-orphan")
     attachments = relationship("Attachment", back_populates="ticket", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_tickets_created_at_id", created_at.desc(), id.desc()),
+        Index("ix_tickets_store_created_at", "store_id", created_at.desc(), id.desc()),
+        Index("ix_tickets_status_priority_created_at", "status", "priority", created_at.desc(), id.desc()),
+        Index("ix_tickets_category_impact_created_at", "category", "impact", created_at.desc()),
+        Index(
+            "ix_tickets_open_store_priority",
+            "store_id",
+            "priority",
+            created_at.desc(),
+            postgresql_where=status.in_(OPEN_STATUSES),
+        ),
+        Index("ix_tickets_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_tickets_parent_id", "parent_id", postgresql_where=parent_id.isnot(None)),
+    )
+
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -72,9 +118,15 @@ class Comment(Base):
     author_name = Column(String(255), nullable=False)
     body = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    search_vector = deferred(Column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}'::regconfig, body)", persisted=True)))
 
     ticket = relationship("Ticket", back_populates="comments")
 
+    __table_args__ = (
+        Index("ix_comments_ticket_id", "ticket_id", "created_at"),
+        Index("ix_comments_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
 
 class Attachment(Base):
     __tablename__ = "attachments"
@@ -86,6 +138,33 @@ class Attachment(Base):
     mime_type = Column(String(255), nullable=False)
     size = Column(Integer, nullable=False)
     url = Column(String(500), nullable=False)
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     ticket = relationship("Ticket", back_populates="attachments")
+
+    __table_args__ = (
+        Index("ix_attachments_ticket_id", "ticket_id", "created_at"),
+        Index("ix_attachments_blob_sha256", "blob_sha256"),
+    )
+
+
+class Blob(Base):
+    # Content-addressed attachment bytes; ref_count is kept by triggers on attachments (0003_attachment_blobs)
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    url = Column(String(500), nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_blobs_unreferenced", "sha256", postgresql_where=ref_count <= 0),)
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = Column(String(255), primary_key=True)
+    tat = Column(DateTime(timezone=True), nullable=False)
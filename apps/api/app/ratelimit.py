@@ -0,0 +1,98 @@
+﻿import hashlib
+import math
+import time
+from datetime import timedelta
+from typing import Callable, Dict, NamedTuple, Protocol, Sequence, Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import Float, func, literal, select
+
+from .config import settings
+
+
+class Bucket(NamedTuple):
+    # Token bucket of `capacity` attempts refilled evenly over `per_seconds`, evaluated as GCRA: one timestamp per key
+    capacity: int
+    per_seconds: float
+
+    @property
+    def interval(self) -> float:
+        return self.per_seconds / self.capacity
+
+    @property
+    def tolerance(self) -> float:
+        return self.interval * (self.capacity - 1)
+
+
+class RateLimiter(Protocol):
+    # Takes one token from each bucket in order and stops at the first empty one; returns seconds to wait, 0 when allowed
+    async def acquire(self, buckets: Sequence[Tuple[str, Bucket]]) -> float: ...
+
+
+class MemoryRateLimiter:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._tats: Dict[str, float] = {}
+
+    async def acquire(self, buckets: Sequence[Tuple[str, Bucket]]) -> float:
+        now = time.monotonic()
+        for key, bucket in buckets:
+            tat = max(self._tats.get(key, now), now)
+            if tat - now > bucket.tolerance:
+                return tat - now - bucket.tolerance
+            self._tats[key] = tat + bucket.interval
+        if len(self._tats) > self.max_keys:
+            # Keys whose bucket has refilled completely carry no state
+            self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+        return 0.0
+
+
+class PostgresRateLimiter:
+    # Shared by every worker; rate_limit_take() (migration 0009) locks the key's row, so concurrent attempts are counted once each
+    async def acquire(self, buckets: Sequence[Tuple[str, Bucket]]) -> float:
+        from .db import async_engine
+
+        # COALESCE evaluates left to right and stops at the first bucket that refuses (non-zero wait)
+        waits = [
+            func.nullif(func.rate_limit_take(key, timedelta(seconds=bucket.interval), timedelta(seconds=bucket.tolerance)), 0)
+            for key, bucket in buckets
+        ]
+        async with async_engine.begin() as conn:
+            wait = await conn.scalar(select(func.coalesce(*waits, literal(0.0, Float))))
+        return float(wait)
+
+
+RATE_LIMIT_BACKENDS: Dict[str, Callable[[], RateLimiter]] = {
+    "memory": MemoryRateLimiter,
+    "postgres": PostgresRateLimiter,
+}
+
+
+def create_rate_limiter(backend: str = settings.login_rate_limit_backend) -> RateLimiter:
+    factory = RATE_LIMIT_BACKENDS.get(backend)
+    if factory is None:
+        raise RuntimeError(f"Unknown rate limit backend: {backend}")
+    return factory()
+
+
+login_limiter = create_rate_limiter()
+LOGIN_IP_BUCKET = Bucket(settings.login_ip_attempts, settings.login_attempt_window_seconds)
+LOGIN_ACCOUNT_BUCKET = Bucket(settings.login_account_attempts, settings.login_attempt_window_seconds)
+
+
+def _bucket_key(kind: str, value: str) -> str:
+    # Caller-supplied parts are hashed so keys have a fixed length (the key column is varchar(255), and memory stays bounded)
+    return f"login:{kind}:{hashlib.sha256(value.encode()).hexdigest()}"
+
+
+async def limit_login(request: Request, account: str) -> None:
+    # Runs before any lookup or hash check; the IP bucket goes first so a refused client stops draining the account's bucket
+    # request.client is the real client only when uvicorn trusts the proxy's X-Forwarded-For (FORWARDED_ALLOW_IPS)
+    client = request.client.host if request.client else "unknown"
+    wait = await login_limiter.acquire([(_bucket_key("ip", client), LOGIN_IP_BUCKET), (_bucket_key("account", account), LOGIN_ACCOUNT_BUCKET)])
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
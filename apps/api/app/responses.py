@@ -0,0 +1,23 @@
+﻿from typing import Any
+from uuid import UUID
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    # asyncpg returns its own UUID subclass, which orjson does not serialize natively
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    # OPT_UTC_Z writes UTC as "Z", matching what pydantic emits for the same datetimes
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(JSONResponse):
+    # Skips response_model validation: for list payloads already shaped from Core rows
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,3 +1,3 @@
-﻿from . import auth, stores, devices, tickets
+﻿from . import auth, stores, devices, tickets, events
 
-__all__ = ["auth", "stores", "devices", "tickets"]
+__all__ = ["auth", "stores", "devices", "tickets", "events"]
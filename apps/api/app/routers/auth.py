@@ -1,24 +1,34 @@
-﻿from datetime import timedelta
+﻿from functools import cache
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import schemas
-from ..config import settings
-from ..db import get_db
+from ..db import get_async_db
 from ..enums import UserRole
 from ..models import Store
-from ..security import create_access_token, verify_password
+from ..ratelimit import limit_login
+from ..security import create_access_token, get_password_hash, password_needs_rehash, run_password_hashing, verify_admin_password, verify_password
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
+@cache
+def _dummy_pin_hash() -> str:
+    return get_password_hash("000000")
+
+
 @router.post("/store/login", response_model=schemas.TokenResponse)
-def store_login(payload: schemas.StoreLoginRequest, db: Session = Depends(get_db)):
-    store = db.query(Store).filter(Store.code == payload.code).first()
-    if not store or not store.is_active:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    if not verify_password(payload.pin, store.pin_hash):
+async def store_login(request: Request, payload: schemas.StoreLoginRequest, db: AsyncSession = Depends(get_async_db)):
+    await limit_login(request, f"store:{payload.code}")
+    store = (await db.execute(select(Store.id, Store.code, Store.pin_hash, Store.is_active).filter(Store.code == payload.code))).first()
+    # Hand the connection back to the pool while bcrypt runs
+    await db.close()
+    # Unknown codes pay for a hash check too, so response time does not reveal which codes exist
+    pin_hash = store.pin_hash if store else await run_password_hashing(_dummy_pin_hash)
+    pin_ok = await run_password_hashing(verify_password, payload.pin, pin_hash)
+    if not store or not store.is_active or not pin_ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     token = create_access_token(
@@ -29,12 +39,19 @@ def store_login(payload: schemas.StoreLoginRequest, db: Session = Depends(get_db
             "store_code": store.code,
         }
     )
+    # Plaintext PINs left over from before hashing (or hashed with other rounds) are upgraded on first successful login
+    if password_needs_rehash(store.pin_hash):
+        pin_hash = await run_password_hashing(get_password_hash, payload.pin)
+        # Only if unchanged meanwhile, so a concurrent PIN reset wins
+        await db.execute(update(Store).filter(Store.id == store.id, Store.pin_hash == store.pin_hash).values(pin_hash=pin_hash))
+        await db.commit()
     return schemas.TokenResponse(token=token)
 
 
 @router.post("/admin/login", response_model=schemas.TokenResponse)
-def admin_login(payload: schemas.AdminLoginRequest):
-    if not verify_password(payload.password, settings.admin_password):
+async def admin_login(request: Request, payload: schemas.AdminLoginRequest):
+    await limit_login(request, "admin")
+    if not await verify_admin_password(payload.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     token = create_access_token({"sub": "admin", "role": UserRole.ADMIN.value})
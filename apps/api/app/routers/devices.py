@@ -1,38 +1,56 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+﻿from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import schemas
+from ..catalog import commit_catalog_change, get_store, get_store_devices
+from ..conditional import not_modified, weak_etag
 from ..dependencies import get_current_admin
-from ..db import get_db
-from ..models import Device, Store
+from ..db import get_async_db
+from ..models import Device
 
 router = APIRouter(prefix="/admin", tags=["devices"])
 
 public_router = APIRouter(prefix="/stores", tags=["devices"])
 
-@router.get("/stores/{store_id}/devices", response_model=list[schemas.DeviceOut])
-def list_devices(store_id: str, db: Session = Depends(get_db), _: dict = Depends(get_current_admin)):
-    store = db.get(Store, store_id)
+
+async def _device_list(db: AsyncSession, store_id: str, if_none_match: str | None, response: Response):
+    store = await get_store(db, store_id)
     if not store:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Store not found")
-    return db.query(Device).filter(Device.store_id == store_id).order_by(Device.created_at.desc()).all()
+    # Hashed from the cached list itself, so a revalidation hit costs no query at all
+    devices = await get_store_devices(db, store.id)
+    etag = weak_etag(*(f"{device.id}@{device.updated_at.isoformat()}" for device in devices))
+    if (unchanged := not_modified(if_none_match, etag, response)) is not None:
+        return unchanged
+    return devices
+
+
+@router.get("/stores/{store_id}/devices", response_model=list[schemas.DeviceOut])
+async def list_devices(
+    store_id: str,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+    _: dict = Depends(get_current_admin),
+):
+    return await _device_list(db, store_id, if_none_match, response)
 
 
 @router.post("/stores/{store_id}/devices", response_model=schemas.DeviceOut, status_code=status.HTTP_201_CREATED)
-def create_device(store_id: str, payload: schemas.DeviceCreate, db: Session = Depends(get_db), _: dict = Depends(get_current_admin)):
-    store = db.get(Store, store_id)
+async def create_device(store_id: str, payload: schemas.DeviceCreate, db: AsyncSession = Depends(get_async_db), _: dict = Depends(get_current_admin)):
+    store = await get_store(db, store_id)
     if not store:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Store not found")
-    device = Device(store_id=store_id, label=payload.label, type=payload.type, serial=payload.serial)
+    device = Device(store_id=store.id, label=payload.label, type=payload.type, serial=payload.serial)
     db.add(device)
-    db.commit()
-    db.refresh(device)
+    await commit_catalog_change(db, store.id)
+    await db.refresh(device)
     return device
 
 
 @router.patch("/devices/{device_id}", response_model=schemas.DeviceOut)
-def update_device(device_id: str, payload: schemas.DeviceUpdate, db: Session = Depends(get_db), _: dict = Depends(get_current_admin)):
-    device = db.get(Device, device_id)
+async def update_device(device_id: str, payload: schemas.DeviceUpdate, db: AsyncSession = Depends(get_async_db), _: dict = Depends(get_current_admin)):
+    device = await db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
     if payload.label is not None:
@@ -41,24 +59,21 @@ def update_device(device_id: str, payload: schemas.DeviceUpdate, db: Session = D
         device.type = payload.type
     if payload.serial is not None:
         device.serial = payload.serial
-    db.commit()
-    db.refresh(device)
+    await commit_catalog_change(db, device.store_id)
+    await db.refresh(device)
     return device
 
 
 @router.delete("/devices/{device_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_device(device_id: str, db: Session = Depends(get_db), _: dict = Depends(get_current_admin)):
-    device = db.get(Device, device_id)
+async def delete_device(device_id: str, db: AsyncSession = Depends(get_async_db), _: dict = Depends(get_current_admin)):
+    device = await db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
-    db.delete(device)
-    db.commit()
+    await db.delete(device)
+    await commit_catalog_change(db, device.store_id)
     return None
 
 
 @public_router.get("/{store_id}/devices", response_model=list[schemas.DeviceOut])
-def list_store_devices(store_id: str, db: Session = Depends(get_db)):
-    store = db.get(Store, store_id)
-    if not store:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Store not found")
-    return db.query(Device).filter(Device.store_id == store_id).order_by(Device.created_at.desc()).all()
+async def list_store_devices(store_id: str, response: Response, if_none_match: str | None = Header(default=None), db: AsyncSession = Depends(get_async_db)):
+    return await _device_list(db, store_id, if_none_match, response)
@@ -0,0 +1,39 @@
+﻿import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+
+from ..config import settings
+from ..events import EventBroker, get_event_broker
+from .tickets import optional_admin
+
+router = APIRouter(tags=["events"])
+
+
+@router.get("/events")
+async def ticket_events(
+    request: Request,
+    store_id: str | None = None,
+    broker: EventBroker = Depends(get_event_broker),
+    admin_ok: bool = Depends(optional_admin),
+):
+    # Admins see every store; stores only their own
+    if not admin_ok and not store_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="store_id is required")
+    scope = store_id if not admin_ok else None
+
+    async def stream():
+        async with broker.subscribe(scope) as queue:
+            yield f"retry: {settings.event_reconnect_seconds * 1000}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.event_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id = f"id: {event['id']}\n" if "id" in event else ""
+                yield f"{event_id}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
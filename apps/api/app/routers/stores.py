@@ -1,54 +1,78 @@
 ﻿import secrets
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import schemas
-from ..db import get_db
-from ..models import Store
-from ..security import get_password_hash
+from ..catalog import commit_catalog_change
+from ..conditional import not_modified, weak_etag
+from ..db import get_async_db
+from ..models import Store, StoreTicketCounter
+from ..security import get_password_hash, run_password_hashing
 
 router = APIRouter(prefix="/admin/stores", tags=["stores"])
 
 
 @router.get("", response_model=list[schemas.StoreOut])
-def list_stores(db: Session = Depends(get_db)):
-    return db.query(Store).order_by(Store.created_at.desc()).all()
+async def list_stores(response: Response, if_none_match: str | None = Header(default=None), db: AsyncSession = Depends(get_async_db)):
+    # The count catches deletes that leave the newest updated_at in place
+    count, last_updated = (await db.execute(select(func.count(), func.max(Store.updated_at)))).one()
+    if (unchanged := not_modified(if_none_match, weak_etag(count, last_updated), response)) is not None:
+        return unchanged
+    return (await db.scalars(select(Store).order_by(Store.created_at.desc()))).all()
+
+
+@router.get("/ticket-counts", response_model=list[schemas.StoreTicketCountsOut])
+async def list_store_ticket_counts(db: AsyncSession = Depends(get_async_db)):
+    # Reads the trigger-maintained counters: O(stores) rather than a scan over tickets
+    rows = await db.execute(
+        select(
+            Store.id.label("store_id"),
+            func.coalesce(StoreTicketCounter.total_count, 0).label("total_count"),
+            func.coalesce(StoreTicketCounter.open_count, 0).label("open_count"),
+            func.coalesce(StoreTicketCounter.open_p1_count, 0).label("open_p1_count"),
+        )
+        .outerjoin(StoreTicketCounter, StoreTicketCounter.store_id == Store.id)
+        .order_by(Store.created_at.desc())
+    )
+    return rows.mappings().all()
 
 
 @router.post("", response_model=schemas.StoreOut, status_code=status.HTTP_201_CREATED)
-def create_store(payload: schemas.StoreCreate, db: Session = Depends(get_db)):
-    existing = db.query(Store).filter(Store.code == payload.code).first()
+async def create_store(payload: schemas.StoreCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = await db.scalar(select(Store).filter(Store.code == payload.code))
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Store code already exists")
-    hashed_pin = get_password_hash(payload.pin)
+    hashed_pin = await run_password_hashing(get_password_hash, payload.pin)
     store = Store(name=payload.name, code=payload.code, pin_hash=hashed_pin, is_active=payload.is_active)
     db.add(store)
-    db.commit()
-    db.refresh(store)
+    await db.flush()
+    await commit_catalog_change(db, store.id)
+    await db.refresh(store)
     return store
 
 
 @router.patch("/{store_id}", response_model=schemas.StoreOut)
-def update_store(store_id: str, payload: schemas.StoreUpdate, db: Session = Depends(get_db)):
-    store = db.get(Store, store_id)
+async def update_store(store_id: str, payload: schemas.StoreUpdate, db: AsyncSession = Depends(get_async_db)):
+    store = await db.get(Store, store_id)
     if not store:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Store not found")
     if payload.name is not None:
         store.name = payload.name
     if payload.is_active is not None:
         store.is_active = payload.is_active
-    db.commit()
-    db.refresh(store)
+    await commit_catalog_change(db, store.id)
+    await db.refresh(store)
     return store
 
 
 @router.post("/{store_id}/reset-pin", response_model=schemas.PinResetResponse)
-def reset_pin(store_id: str, db: Session = Depends(get_db)):
-    store = db.get(Store, store_id)
+async def reset_pin(store_id: str, db: AsyncSession = Depends(get_async_db)):
+    store = await db.get(Store, store_id)
     if not store:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Store not found")
     new_pin = str(secrets.randbelow(899999) + 100000)
-    store.pin_hash = get_password_hash(new_pin)
-    db.commit()
+    store.pin_hash = await run_password_hashing(get_password_hash, new_pin)
+    await db.commit()
     return schemas.PinResetResponse(pin=new_pin)
@@ -1,13 +1,31 @@
-﻿from datetime import datetime
+﻿import csv
+import enum
+import io
+from datetime import datetime
+from typing import Literal
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func, literal, literal_column, null, select, tuple_, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from .. import schemas
-from ..db import get_db
-from ..enums import AuthorRole, Category, Impact, Priority, Status
-from ..models import Attachment, Comment, Device, Store, Ticket
-from ..storage import get_storage
+from ..blobs import store_blob
+from ..catalog import get_store, get_store_devices
+from ..conditional import etag_matches, not_modified, weak_etag
+from ..config import settings
+from ..db import AsyncSessionLocal, get_async_db
+from ..enums import AuthorRole, Category, CloseCode, Impact, Priority, Status, TicketEventType, UserRole
+from ..events import publish_event, publish_events
+from ..incidents import find_incident_parent
+from ..models import SEARCH_CONFIG, Attachment, Comment, Device, Store, Ticket
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, decode_rank_cursor, encode_cursor, encode_rank_cursor
+from ..ratelimit import limit_login
+from ..responses import FastJSONResponse, dumps
+from ..security import admin_password_remembered, decode_token, oauth2_scheme, verify_admin_password
+from ..storage import Storage, content_disposition, get_storage
 
 router = APIRouter(tags=["tickets"])
 
@@ -17,31 +35,50 @@ PRIORITY_MAP = {
     Impact.INFO: Priority.P3,
 }
 
+# Detail views batch-load children in one query each
+TICKET_DETAIL_OPTIONS = (selectinload(Ticket.comments), selectinload(Ticket.attachments))
+# List views select plain columns and encode them directly: no ORM identity map, no from_attributes validation
+TICKET_SUMMARY_COLUMNS = tuple(getattr(Ticket, name) for name in schemas.TicketSummaryOut.model_fields)
+# Refreshing only columns keeps already-loaded collections; async sessions cannot lazy-load them afterwards
+TICKET_COLUMNS = [column.key for column in Ticket.__table__.columns if column.computed is None]
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, FragmentDelimiter=\" … \""
 
-def optional_admin(x_admin_password: str | None = Header(default=None)):
-    from ..config import settings
 
-    if x_admin_password and x_admin_password == settings.admin_password:
-        return True
+async def optional_admin(request: Request, credentials=Depends(oauth2_scheme), x_admin_password: str | None = Header(default=None)) -> bool:
+    # A bearer token from /auth/admin/login is a cached dictionary lookup; X-Admin-Password stays for older clients.
+    # The web client sends its admin secret as both, so a bearer that is not an admin token falls through to the header
+    if credentials is not None:
+        try:
+            if decode_token(credentials.credentials).get("role") == UserRole.ADMIN.value:
+                return True
+        except HTTPException:
+            pass
+    if x_admin_password:
+        if admin_password_remembered(x_admin_password):
+            return True
+        # Unknown secrets share the admin login buckets, so the header is neither an unlimited password oracle nor a way to flood the hash pool
+        await limit_login(request, "admin")
+        return await verify_admin_password(x_admin_password)
     return False
 
 
-def require_admin(x_admin_password: str | None = Header(default=None)):
-    if not optional_admin(x_admin_password):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin password required")
+def require_admin(admin_ok: bool = Depends(optional_admin)):
+    if not admin_ok:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token or password required")
     return True
 
 
 @router.post("/tickets", response_model=schemas.TicketOut, status_code=status.HTTP_201_CREATED)
-def create_ticket(payload: schemas.TicketCreate, db: Session = Depends(get_db)):
-    store = db.get(Store, payload.store_id)
+async def create_ticket(payload: schemas.TicketCreate, db: AsyncSession = Depends(get_async_db)):
+    store = await get_store(db, payload.store_id)
     if not store or not store.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid store")
     if payload.device_id:
-        device = db.get(Device, payload.device_id)
-        if not device or str(device.store_id) != str(payload.store_id):
+        devices = await get_store_devices(db, payload.store_id)
+        if not any(device.id == payload.device_id for device in devices):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid device")
     priority = PRIORITY_MAP.get(payload.impact, Priority.P3)
+    parent_id = await find_incident_parent(db, payload.category, payload.impact, payload.title, payload.description)
     ticket = Ticket(
         store_id=payload.store_id,
         device_id=payload.device_id,
@@ -52,88 +89,375 @@ def create_ticket(payload: schemas.TicketCreate, db: Session = Depends(get_db)):
         impact=payload.impact,
         priority=priority,
         status=Status.OPEN,
+        parent_id=parent_id,
+        comments=[],
+        attachments=[],
     )
     db.add(ticket)
-    db.commit()
-    db.refresh(ticket)
+    await db.flush()
+    await publish_event(db, TicketEventType.TICKET_CREATED, ticket, parent_id=parent_id)
+    await db.commit()
+    await db.refresh(ticket, attribute_names=TICKET_COLUMNS)
     return ticket
 
 
-@router.get("/tickets", response_model=list[schemas.TicketOut])
-def list_tickets(
-    store_id: str | None = None,
+def ticket_filters(
+    store_id: UUID | None = None,
     category: Category | None = None,
     status_filter: Status | None = None,
     priority: Priority | None = None,
     impact: Impact | None = None,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
-    db: Session = Depends(get_db),
+    parent_id: UUID | None = None,
+) -> schemas.AdminTicketFilter:
+    return schemas.AdminTicketFilter(
+        store_id=store_id,
+        category=category,
+        status=status_filter,
+        priority=priority,
+        impact=impact,
+        start_date=start_date,
+        end_date=end_date,
+        parent_id=parent_id,
+    )
+
+
+def _filter_tickets(query, filters: schemas.AdminTicketFilter):
+    if filters.store_id:
+        query = query.filter(Ticket.store_id == filters.store_id)
+    if filters.category:
+        query = query.filter(Ticket.category == filters.category)
+    if filters.status:
+        query = query.filter(Ticket.status == filters.status)
+    if filters.priority:
+        query = query.filter(Ticket.priority == filters.priority)
+    if filters.impact:
+        query = query.filter(Ticket.impact == filters.impact)
+    if filters.start_date:
+        query = query.filter(Ticket.created_at >= filters.start_date)
+    if filters.end_date:
+        query = query.filter(Ticket.created_at <= filters.end_date)
+    if filters.parent_id:
+        query = query.filter(Ticket.parent_id == filters.parent_id)
+    return query
+
+
+def _ticket_page(query, limit: int, cursor: str | None):
+    # Keyset on (created_at, id): id breaks ties between tickets sharing a timestamp
+    if cursor:
+        created_at, ticket_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Ticket.created_at, Ticket.id) < (created_at, ticket_id))
+    return query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit + 1)
+
+
+async def _paginate_tickets(db: AsyncSession, query, limit: int, cursor: str | None) -> FastJSONResponse:
+    rows = (await db.execute(_ticket_page(query, limit, cursor))).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return FastJSONResponse({"items": [{**row, "match": None} for row in rows], "next_cursor": next_cursor})
+
+
+async def _search_tickets(db: AsyncSession, filters: schemas.AdminTicketFilter, q: str, limit: int, cursor: str | None) -> FastJSONResponse:
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    # Both GIN indexes produce candidates; the filters apply inside each branch so only in-scope tickets get ranked,
+    # and a ticket matched through several comments keeps its best rank
+    hits = union_all(
+        _filter_tickets(
+            select(Ticket.id.label("ticket_id"), func.ts_rank(Ticket.search_vector, tsquery).label("rank")).filter(Ticket.search_vector.bool_op("@@")(tsquery)),
+            filters,
+        ),
+        _filter_tickets(
+            select(Comment.ticket_id, func.ts_rank(Comment.search_vector, tsquery))
+            .join(Ticket, Ticket.id == Comment.ticket_id)
+            .filter(Comment.search_vector.bool_op("@@")(tsquery)),
+            filters,
+        ),
+    ).subquery()
+    ranked = select(hits.c.ticket_id, func.max(hits.c.rank).label("rank")).group_by(hits.c.ticket_id).subquery()
+    page = select(ranked.c.ticket_id.label("id"), ranked.c.rank)
+    # Keyset on (rank, id), same as the created_at listing
+    if cursor:
+        rank, ticket_id = decode_rank_cursor(cursor)
+        page = page.filter(tuple_(ranked.c.rank, ranked.c.ticket_id) < (rank, ticket_id))
+    page = page.order_by(ranked.c.rank.desc(), ranked.c.ticket_id.desc()).limit(limit + 1).subquery()
+
+    # ts_headline re-parses the text, so it only runs for the rows on this page
+    best_comment = (
+        select(Comment.body)
+        .filter(Comment.ticket_id == Ticket.id, Comment.search_vector.bool_op("@@")(tsquery))
+        .order_by(func.ts_rank(Comment.search_vector, tsquery).desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    snippet_text = func.concat_ws(" … ", Ticket.description, Ticket.resolution_note, best_comment)
+    rows = (
+        await db.execute(
+            select(
+                *TICKET_SUMMARY_COLUMNS,
+                page.c.rank.label("match_rank"),
+                func.ts_headline(SEARCH_CONFIG, Ticket.title, tsquery, f"HighlightAll=true, {SEARCH_HEADLINE_OPTIONS}").label("match_title"),
+                func.ts_headline(SEARCH_CONFIG, snippet_text, tsquery, f"MaxFragments=2, MaxWords=25, MinWords=8, {SEARCH_HEADLINE_OPTIONS}").label("match_snippet"),
+            )
+            .join(page, page.c.id == Ticket.id)
+            .order_by(page.c.rank.desc(), Ticket.id.desc())
+        )
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1].match_rank, rows[-1].id)
+    items = [
+        {
+            **{column.key: value for column, value in zip(TICKET_SUMMARY_COLUMNS, row)},
+            "match": {"rank": row.match_rank, "title": row.match_title, "snippet": row.match_snippet},
+        }
+        for row in rows
+    ]
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@router.get("/tickets", response_model=schemas.TicketPage)
+async def list_tickets(
+    filters: schemas.AdminTicketFilter = Depends(ticket_filters),
+    q: str | None = Query(default=None, min_length=1, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    if not store_id:
+    if not filters.store_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="store_id is required")
-    query = db.query(Ticket)
-    if store_id:
-        query = query.filter(Ticket.store_id == store_id)
-    if category:
-        query = query.filter(Ticket.category == category)
-    if status_filter:
-        query = query.filter(Ticket.status == status_filter)
-    if priority:
-        query = query.filter(Ticket.priority == priority)
-    if impact:
-        query = query.filter(Ticket.impact == impact)
-    if start_date:
-        query = query.filter(Ticket.created_at >= start_date)
-    if end_date:
-        query = query.filter(Ticket.created_at <= end_date)
-    return query.order_by(Ticket.created_at.desc()).all()
-
-
-@router.get("/admin/tickets", response_model=list[schemas.TicketOut])
-def list_tickets_admin(
-    store_id: str | None = None,
-    category: Category | None = None,
-    status_filter: Status | None = None,
-    priority: Priority | None = None,
-    impact: Impact | None = None,
-    start_date: datetime | None = None,
-    end_date: datetime | None = None,
-    db: Session = Depends(get_db),
+    if q:
+        return await _search_tickets(db, filters, q, limit, cursor)
+    query = _filter_tickets(select(*TICKET_SUMMARY_COLUMNS), filters)
+    return await _paginate_tickets(db, query, limit, cursor)
+
+
+@router.get("/admin/tickets", response_model=schemas.TicketPage)
+async def list_tickets_admin(
+    filters: schemas.AdminTicketFilter = Depends(ticket_filters),
+    q: str | None = Query(default=None, min_length=1, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    _: bool = Depends(require_admin),
+):
+    if q:
+        return await _search_tickets(db, filters, q, limit, cursor)
+    query = _filter_tickets(select(*TICKET_SUMMARY_COLUMNS), filters)
+    return await _paginate_tickets(db, query, limit, cursor)
+
+
+@router.get("/admin/tickets/stats", response_model=schemas.TicketStats)
+async def ticket_stats_admin(
+    filters: schemas.AdminTicketFilter = Depends(ticket_filters),
+    bucket: Literal["day", "week"] = "day",
+    db: AsyncSession = Depends(get_async_db),
+    _: bool = Depends(require_admin),
+):
+    # Literals rather than binds: GROUP BY must repeat the select expression verbatim
+    timezone = settings.report_timezone.replace("'", "''")
+    bucket_start = func.date_trunc(literal_column(f"'{bucket}'"), func.timezone(literal_column(f"'{timezone}'"), Ticket.created_at))
+    close_seconds = func.extract("epoch", Ticket.closed_at - Ticket.created_at)
+    dimensions = [Ticket.status, Ticket.priority, Ticket.category, Ticket.impact, Ticket.store_id]
+
+    # Counts per dimension are cheap hash aggregates; percentiles need a sort, so they are only
+    # computed for the timeline buckets and the grand total. Both halves go out as one statement.
+    breakdown = _filter_tickets(
+        select(
+            func.grouping(*dimensions).label("grouping"),
+            *dimensions,
+            null().label("bucket"),
+            func.count().label("total"),
+            func.count(Ticket.closed_at).label("closed"),
+            null().label("mean_seconds"),
+            null().label("p50_seconds"),
+            null().label("p90_seconds"),
+        ).group_by(func.grouping_sets(*[tuple_(dimension) for dimension in dimensions])),
+        filters,
+    )
+    timeline = _filter_tickets(
+        select(
+            # -1 marks timeline rows, -2 the grand total
+            (-1 - func.grouping(bucket_start)).label("grouping"),
+            *[null() for _ in dimensions],
+            bucket_start,
+            func.count(),
+            func.count(Ticket.closed_at),
+            func.avg(close_seconds),
+            func.percentile_cont(0.5).within_group(close_seconds),
+            func.percentile_cont(0.9).within_group(close_seconds),
+        ).group_by(func.grouping_sets(tuple_(bucket_start), tuple_())),
+        filters,
+    )
+    rows = (await db.execute(union_all(breakdown, timeline))).all()
+
+    breakdowns = [{} for _ in dimensions]
+    stats = {"total": 0, "time_to_close": {"closed": 0}, "buckets": []}
+    all_bits = (1 << len(dimensions)) - 1
+    for row in rows:
+        if row.grouping < 0:
+            close_time = {
+                "closed": row.closed,
+                "mean_seconds": row.mean_seconds,
+                "p50_seconds": row.p50_seconds,
+                "p90_seconds": row.p90_seconds,
+            }
+            if row.grouping == -2:
+                stats["total"] = row.total
+                stats["time_to_close"] = close_time
+            else:
+                stats["buckets"].append({"bucket": row.bucket, "total": row.total, **close_time})
+            continue
+        # grouping() sets a bit for each rolled-up dimension, the first dimension being the highest bit
+        position = len(dimensions) - (all_bits ^ row.grouping).bit_length()
+        breakdowns[position][row[position + 1]] = row.total
+    stats["buckets"].sort(key=lambda item: item["bucket"])
+    by_status, by_priority, by_category, by_impact, by_store = breakdowns
+    return {
+        **stats,
+        "by_status": by_status,
+        "by_priority": by_priority,
+        "by_category": by_category,
+        "by_impact": by_impact,
+        "by_store": by_store,
+    }
+
+
+EXPORT_COLUMNS = (
+    Ticket.id,
+    Ticket.created_at,
+    Store.code.label("store_code"),
+    Store.name.label("store_name"),
+    Device.label.label("device_label"),
+    Ticket.requester_name,
+    Ticket.title,
+    Ticket.description,
+    Ticket.category,
+    Ticket.impact,
+    Ticket.priority,
+    Ticket.status,
+    Ticket.assigned_to,
+    Ticket.updated_at,
+    Ticket.closed_at,
+    Ticket.close_code,
+    Ticket.resolution_note,
+    Ticket.parent_id,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def _export_rows(query, export_format: str):
+    # Own session: the stream outlives the request's dependencies, and a server-side cursor needs its transaction open
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.export_batch_size))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # BOM so Excel opens the Turkish text as UTF-8
+            writer.writerow(EXPORT_FIELDS)
+            yield "\ufeff".encode() + buffer.getvalue().encode()
+            async for rows in result.partitions():
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([_csv_value(value) for value in row] for row in rows)
+                yield buffer.getvalue().encode()
+        else:
+            async for rows in result.mappings().partitions():
+                yield b"".join(dumps(dict(row)) + b"\n" for row in rows)
+
+
+@router.get("/admin/tickets/export")
+async def export_tickets_admin(
+    filters: schemas.AdminTicketFilter = Depends(ticket_filters),
+    export_format: Literal["csv", "ndjson"] = Query(default="csv", alias="format"),
     _: bool = Depends(require_admin),
 ):
-    query = db.query(Ticket)
-    if store_id:
-        query = query.filter(Ticket.store_id == store_id)
-    if category:
-        query = query.filter(Ticket.category == category)
-    if status_filter:
-        query = query.filter(Ticket.status == status_filter)
-    if priority:
-        query = query.filter(Ticket.priority == priority)
-    if impact:
-        query = query.filter(Ticket.impact == impact)
-    if start_date:
-        query = query.filter(Ticket.created_at >= start_date)
-    if end_date:
-        query = query.filter(Ticket.created_at <= end_date)
-    return query.order_by(Ticket.created_at.desc()).all()
+    query = _filter_tickets(
+        select(*EXPORT_COLUMNS).join(Store, Store.id == Ticket.store_id).outerjoin(Device, Device.id == Ticket.device_id),
+        filters,
+    ).order_by(Ticket.created_at, Ticket.id)
+    filename = f"tickets-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format}"
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(query, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(filename, "attachment"), "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/tickets/{ticket_id}", response_model=schemas.TicketOut)
-def get_ticket(ticket_id: str, store_id: str | None = None, db: Session = Depends(get_db), admin_ok: bool = Depends(optional_admin)):
-    ticket = db.get(Ticket, ticket_id)
-    if not ticket:
+async def get_ticket(
+    ticket_id: str,
+    response: Response,
+    store_id: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+    admin_ok: bool = Depends(optional_admin),
+):
+    # Validator from index-only aggregates: comments and attachments do not touch the ticket's updated_at
+    children = [
+        select(aggregate).filter(model.ticket_id == Ticket.id).scalar_subquery()
+        for model in (Comment, Attachment)
+        for aggregate in (func.count(), func.max(model.created_at))
+    ]
+    version = (await db.execute(select(Ticket.store_id, Ticket.updated_at, *children).filter(Ticket.id == ticket_id))).first()
+    if not version:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
     if not admin_ok:
-        if not store_id or str(ticket.store_id) != store_id:
+        if not store_id or str(version.store_id) != store_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    if (unchanged := not_modified(if_none_match, weak_etag(*version[1:]), response)) is not None:
+        return unchanged
+    ticket = await db.get(Ticket, ticket_id, options=TICKET_DETAIL_OPTIONS)
+    if not ticket:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
     return ticket
 
 
+@router.patch("/admin/tickets/bulk", response_model=schemas.TicketBulkUpdateResult)
+async def bulk_update_tickets_admin(payload: schemas.TicketBulkUpdate, db: AsyncSession = Depends(get_async_db), _: bool = Depends(require_admin)):
+    # Same rules as update_ticket_admin, expressed per row in SQL so one UPDATE covers every ticket
+    changes = payload.update
+    values = {}
+    if changes.status is not None:
+        values["status"] = changes.status
+        if changes.status == Status.CLOSED:
+            values["closed_at"] = func.now()
+    elif changes.assigned_to:
+        values["status"] = case((Ticket.status == Status.OPEN, Status.IN_PROGRESS), else_=Ticket.status)
+    for field in ("priority", "assigned_to", "close_code", "resolution_note"):
+        if getattr(changes, field) is not None:
+            values[field] = getattr(changes, field)
+    if not values:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nothing to update")
+
+    stmt = update(Ticket).values(**values).returning(*TICKET_SUMMARY_COLUMNS).execution_options(synchronize_session=False)
+    if payload.ids is not None:
+        stmt = stmt.filter(Ticket.id.in_(payload.ids))
+    else:
+        stmt = _filter_tickets(stmt, payload.filter)
+    rows = (await db.execute(stmt)).all()
+    await publish_events(db, TicketEventType.TICKET_UPDATED, rows, "assigned_to")
+    await db.commit()
+    return {"updated": len(rows), "items": rows}
+
+
 @router.patch("/admin/tickets/{ticket_id}", response_model=schemas.TicketOut)
-def update_ticket_admin(ticket_id: str, payload: schemas.TicketUpdateAdmin, db: Session = Depends(get_db), _: bool = Depends(require_admin)):
-    ticket = db.get(Ticket, ticket_id)
+async def update_ticket_admin(ticket_id: str, payload: schemas.TicketUpdateAdmin, db: AsyncSession = Depends(get_async_db), _: bool = Depends(require_admin)):
+    ticket = await db.get(Ticket, ticket_id, options=TICKET_DETAIL_OPTIONS)
     if not ticket:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
     # If only assignment is made, mark as in progress to surface acceptance to requester
@@ -142,7 +466,8 @@ def update_ticket_admin(ticket_id: str, payload: schemas.TicketUpdateAdmin, db:
     if payload.status is not None:
         ticket.status = payload.status
         if payload.status == Status.CLOSED:
-            ticket.closed_at = datetime.utcnow()
+            # Database clock, like the bulk and cluster close paths
+            ticket.closed_at = func.now()
     if payload.priority is not None:
         ticket.priority = payload.priority
     if payload.assigned_to is not None:
@@ -151,14 +476,64 @@ def update_ticket_admin(ticket_id: str, payload: schemas.TicketUpdateAdmin, db:
         ticket.close_code = payload.close_code
     if payload.resolution_note is not None:
         ticket.resolution_note = payload.resolution_note
-    db.commit()
-    db.refresh(ticket)
+    await publish_event(db, TicketEventType.TICKET_UPDATED, ticket, assigned_to=ticket.assigned_to)
+    await db.commit()
+    await db.refresh(ticket, attribute_names=TICKET_COLUMNS)
+    return ticket
+
+
+@router.put("/admin/tickets/{ticket_id}/parent", response_model=schemas.TicketOut)
+async def set_ticket_parent(ticket_id: UUID, payload: schemas.TicketParentUpdate, db: AsyncSession = Depends(get_async_db), _: bool = Depends(require_admin)):
+    ticket = await db.get(Ticket, ticket_id, options=TICKET_DETAIL_OPTIONS)
+    if not ticket:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
+    if payload.parent_id is not None:
+        # Clusters are one level deep so resolving a root reaches every duplicate
+        if payload.parent_id == ticket.id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A ticket cannot be its own parent")
+        parent = await db.get(Ticket, payload.parent_id)
+        if not parent:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid parent ticket")
+        if parent.parent_id is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Parent ticket is itself a duplicate")
+        if await db.scalar(select(Ticket.id).filter(Ticket.parent_id == ticket.id).limit(1)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ticket has duplicates of its own")
+    ticket.parent_id = payload.parent_id
+    await publish_event(db, TicketEventType.TICKET_UPDATED, ticket, parent_id=ticket.parent_id)
+    await db.commit()
+    await db.refresh(ticket, attribute_names=TICKET_COLUMNS)
     return ticket
 
 
+@router.post("/admin/tickets/{ticket_id}/resolve-cluster", response_model=schemas.TicketBulkUpdateResult)
+async def resolve_ticket_cluster(ticket_id: UUID, payload: schemas.TicketClusterResolve, db: AsyncSession = Depends(get_async_db), _: bool = Depends(require_admin)):
+    root_id = (await db.execute(select(func.coalesce(Ticket.parent_id, Ticket.id)).filter(Ticket.id == ticket_id))).scalar()
+    if root_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
+    # The root keeps the given close code, its open duplicates close as DUPLICATE in the same statement
+    values = {
+        "status": Status.CLOSED,
+        "closed_at": func.now(),
+        "close_code": case((Ticket.id == root_id, literal(payload.close_code, Ticket.close_code.type)), else_=literal(CloseCode.DUPLICATE, Ticket.close_code.type)),
+    }
+    if payload.resolution_note is not None:
+        values["resolution_note"] = payload.resolution_note
+    stmt = (
+        update(Ticket)
+        .values(**values)
+        .filter((Ticket.id == root_id) | (Ticket.parent_id == root_id), Ticket.status != Status.CLOSED)
+        .returning(*TICKET_SUMMARY_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+    await publish_events(db, TicketEventType.TICKET_UPDATED, rows, "assigned_to")
+    await db.commit()
+    return {"updated": len(rows), "items": rows}
+
+
 @router.post("/tickets/{ticket_id}/comments", response_model=schemas.CommentOut, status_code=status.HTTP_201_CREATED)
-def add_comment(ticket_id: str, payload: schemas.CommentCreate, store_id: str | None = None, db: Session = Depends(get_db), admin_ok: bool = Depends(optional_admin)):
-    ticket = db.get(Ticket, ticket_id)
+async def add_comment(ticket_id: str, payload: schemas.CommentCreate, store_id: str | None = None, db: AsyncSession = Depends(get_async_db), admin_ok: bool = Depends(optional_admin)):
+    ticket = await db.get(Ticket, ticket_id)
     if not ticket:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
     if not admin_ok:
@@ -166,31 +541,81 @@ def add_comment(ticket_id: str, payload: schemas.CommentCreate, store_id: str |
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
     comment = Comment(ticket_id=ticket_id, author_role=AuthorRole.STORE, author_name=payload.author_name, body=payload.body)
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
+    await db.flush()
+    await publish_event(db, TicketEventType.COMMENT_CREATED, ticket, comment_id=str(comment.id))
+    await db.commit()
+    await db.refresh(comment)
     return comment
 
 
 @router.post("/tickets/{ticket_id}/attachments", response_model=schemas.AttachmentOut, status_code=status.HTTP_201_CREATED)
-def upload_attachment(ticket_id: str, file: UploadFile = File(...), store_id: str | None = None, db: Session = Depends(get_db), admin_ok: bool = Depends(optional_admin)):
-    ticket = db.get(Ticket, ticket_id)
+async def upload_attachment(
+    ticket_id: str,
+    file: UploadFile = File(...),
+    store_id: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    admin_ok: bool = Depends(optional_admin),
+    storage: Storage = Depends(get_storage),
+):
+    ticket = await db.get(Ticket, ticket_id)
     if not ticket:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
     if not admin_ok:
         if not store_id or str(ticket.store_id) != store_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
     author_role = AuthorRole.ADMIN if admin_ok else AuthorRole.STORE
-    storage = get_storage()
-    saved_name, url, size = storage.save(file)
+    # Release the connection while the upload is copied (up to max_upload_bytes); the loaded ticket stays usable detached
+    await db.close()
+    staged = await storage.stage(file)
+    saved = await store_blob(db, storage, staged)
     attachment = Attachment(
-        ticket_id=ticket_id,
+        ticket_id=ticket.id,
         uploader_role=author_role,
-        file_name=saved_name,
+        file_name=file.filename or saved.name,
         mime_type=file.content_type or "application/octet-stream",
-        size=size,
-        url=url,
+        size=saved.size,
+        url=saved.url,
+        blob_sha256=saved.sha256,
     )
     db.add(attachment)
-    db.commit()
-    db.refresh(attachment)
+    await db.flush()
+    await publish_event(db, TicketEventType.ATTACHMENT_CREATED, ticket, attachment_id=str(attachment.id))
+    await db.commit()
+    await db.refresh(attachment)
     return attachment
+
+
+@router.api_route("/tickets/{ticket_id}/attachments/{attachment_id}", methods=["GET", "HEAD"])
+async def download_attachment(
+    ticket_id: str,
+    attachment_id: str,
+    store_id: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+    admin_ok: bool = Depends(optional_admin),
+    storage: Storage = Depends(get_storage),
+):
+    row = (
+        await db.execute(
+            select(Attachment, Ticket.store_id)
+            .join(Ticket, Ticket.id == Attachment.ticket_id)
+            .filter(Attachment.id == attachment_id, Attachment.ticket_id == ticket_id)
+        )
+    ).first()
+    # Release the connection now; the transfer itself may take minutes
+    await db.close()
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+    attachment, ticket_store_id = row
+    if not admin_ok:
+        if not store_id or str(ticket_store_id) != store_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    headers = {"Cache-Control": "private, max-age=31536000, immutable"}
+    if attachment.blob_sha256:
+        # Content-addressed bytes: the hash is a strong validator
+        headers["ETag"] = f'"{attachment.blob_sha256}"'
+        if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    name = attachment.blob_sha256 or attachment.url.rsplit("/", 1)[-1]
+    return await storage.download_response(name, attachment.mime_type, attachment.file_name, headers)
@@ -1,8 +1,8 @@
 ﻿from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 from .enums import AuthorRole, Category, CloseCode, Impact, Priority, Status
 
@@ -12,12 +12,12 @@ class TokenResponse(BaseModel):
 
 
 class StoreLoginRequest(BaseModel):
-    code: str
-    pin: str
+    code: str = Field(max_length=50)
+    pin: str = Field(max_length=255)
 
 
 class AdminLoginRequest(BaseModel):
-    password: str
+    password: str = Field(max_length=255)
 
 
 class StoreBase(BaseModel):
@@ -38,10 +38,18 @@ class StoreUpdate(BaseModel):
 class StoreOut(StoreBase):
     id: UUID
     created_at: datetime
+    updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class StoreTicketCountsOut(BaseModel):
+    store_id: UUID
+    total_count: int
+    open_count: int
+    open_p1_count: int
+
+
 class PinResetResponse(BaseModel):
     pin: str
 
@@ -66,6 +74,7 @@ class DeviceOut(DeviceBase):
     id: UUID
     store_id: UUID
     created_at: datetime
+    updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -91,6 +100,7 @@ class AdminTicketFilter(TicketFilter):
     category: Optional[Category] = None
     priority: Optional[Priority] = None
     impact: Optional[Impact] = None
+    parent_id: Optional[UUID] = None
 
 
 class TicketUpdateAdmin(BaseModel):
@@ -101,6 +111,30 @@ class TicketUpdateAdmin(BaseModel):
     resolution_note: Optional[str] = None
 
 
+class TicketParentUpdate(BaseModel):
+    parent_id: Optional[UUID]
+
+
+class TicketClusterResolve(BaseModel):
+    close_code: CloseCode = CloseCode.FIXED
+    resolution_note: Optional[str] = None
+
+
+class TicketBulkUpdate(BaseModel):
+    ids: Optional[List[UUID]] = Field(default=None, min_length=1, max_length=1000)
+    filter: Optional[AdminTicketFilter] = None
+    update: TicketUpdateAdmin
+
+    @model_validator(mode="after")
+    def one_target(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Provide either ids or filter")
+        # An empty filter would match every ticket
+        if self.filter is not None and not self.filter.model_dump(exclude_none=True):
+            raise ValueError("filter must set at least one field")
+        return self
+
+
 class CommentCreate(BaseModel):
     author_name: str
     body: str
@@ -129,8 +163,14 @@ class AttachmentOut(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+    @model_validator(mode="after")
+    def download_url(self):
+        # The stored url is a storage locator; clients always go through the authorized download route
+        self.url = f"/tickets/{self.ticket_id}/attachments/{self.id}"
+        return self
+
 
-class TicketOut(BaseModel):
+class TicketSummaryOut(BaseModel):
     id: UUID
     store_id: UUID
     device_id: Optional[UUID]
@@ -147,7 +187,54 @@ class TicketOut(BaseModel):
     closed_at: Optional[datetime]
     close_code: Optional[CloseCode]
     resolution_note: Optional[str]
+    parent_id: Optional[UUID]
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TicketOut(TicketSummaryOut):
     comments: List[CommentOut] = []
     attachments: List[AttachmentOut] = []
 
-    model_config = ConfigDict(from_attributes=True)
+
+class TicketSearchMatch(BaseModel):
+    rank: float
+    title: str
+    snippet: str
+
+
+class TicketListItem(TicketSummaryOut):
+    match: Optional[TicketSearchMatch] = None
+
+
+class TicketBulkUpdateResult(BaseModel):
+    updated: int
+    items: List[TicketSummaryOut]
+
+
+class TicketPage(BaseModel):
+    items: List[TicketListItem]
+    next_cursor: Optional[str] = None
+
+
+class CloseTimeStats(BaseModel):
+    closed: int
+    mean_seconds: Optional[float] = None
+    p50_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+
+
+class TicketStatsBucket(CloseTimeStats):
+    bucket: datetime
+    total: int
+
+
+class TicketStats(BaseModel):
+    total: int
+    by_status: Dict[Status, int]
+    by_priority: Dict[Priority, int]
+    by_category: Dict[Category, int]
+    by_impact: Dict[Impact, int]
+    by_store: Dict[UUID, int]
+    time_to_close: CloseTimeStats
+    buckets: List[TicketStatsBucket]
@@ -1,22 +1,122 @@
-﻿from datetime import datetime, timedelta
-from typing import Any, Dict
+﻿import asyncio
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, TypeVar
 
+import bcrypt
 from fastapi import HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from .config import settings
 from .enums import UserRole
 
-# Simplified hashing (auth not used anymore); store plain text for now to avoid bcrypt backend issues
 oauth2_scheme = HTTPBearer(auto_error=False)
 
 
+class VerifiedTokenCache:
+    # LRU of already verified payloads, keyed by token digest so raw tokens are not kept; an entry never outlives its exp.
+    # Shared by the event loop and the threadpool (sync dependencies), so every access goes through the lock.
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Dict[str, Any] | None:
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        if self.max_size <= 0 or "exp" not in payload:
+            return
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            self._entries[key] = (float(payload["exp"]), payload)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, entries = self.hits, self.misses, len(self._entries)
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+token_cache = VerifiedTokenCache(settings.auth_token_cache_size)
+
+
+T = TypeVar("T")
+
+# bcrypt is deliberately slow; its own small pool keeps login bursts off the event loop and out of the shared threadpool
+_hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password-hash")
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+def _secret(password: str) -> bytes:
+    # bcrypt only reads 72 bytes and bcrypt>=5 refuses longer input instead of truncating
+    return password.encode()[:72]
+
+
+def is_password_hash(value: str) -> bool:
+    return value.startswith(BCRYPT_PREFIXES)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return plain_password == hashed_password
+    if is_password_hash(hashed_password):
+        return bcrypt.checkpw(_secret(plain_password), hashed_password.encode())
+    # Plaintext PINs written before hashing was introduced; store_login rehashes them on success
+    return hmac.compare_digest(plain_password.encode(), hashed_password.encode())
 
 
 def get_password_hash(password: str) -> str:
-    return password
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(settings.bcrypt_rounds)).decode()
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return not is_password_hash(hashed_password) or int(hashed_password.split("$")[2]) != settings.bcrypt_rounds
+
+
+async def run_password_hashing(func: Callable[..., T], *args: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+
+
+_admin_password_digest: bytes | None = None
+
+
+def admin_password_remembered(password: str) -> bool:
+    # ADMIN_PASSWORD may be a bcrypt hash; the last accepted secret is remembered so legacy header auth does not pay bcrypt per request
+    digest = hashlib.sha256(password.encode()).digest()
+    return _admin_password_digest is not None and hmac.compare_digest(digest, _admin_password_digest)
+
+
+async def verify_admin_password(password: str) -> bool:
+    # Callers rate-limit before this: anything not remembered costs a full bcrypt check
+    global _admin_password_digest
+    if admin_password_remembered(password):
+        return True
+    if not await run_password_hashing(verify_password, password, settings.admin_password):
+        return False
+    _admin_password_digest = hashlib.sha256(password.encode()).digest()
+    return True
 
 
 def create_access_token(data: Dict[str, Any], expires_delta: timedelta | None = None) -> str:
@@ -27,10 +127,15 @@ def create_access_token(data: Dict[str, Any], expires_delta: timedelta | None =
 
 
 def decode_token(token: str) -> Dict[str, Any]:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
-        return jwt.decode(token, settings.jwt_secret, algorithms=["HS256"])
+        payload = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"])
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+    token_cache.put(token, payload)
+    return payload
 
 
 def require_token(credentials: HTTPAuthorizationCredentials | None) -> str:
@@ -1,39 +1,274 @@
-﻿import os
+﻿import hashlib
+import os
 import uuid
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from urllib.parse import quote
+from typing import BinaryIO, Callable, Dict, NamedTuple, Protocol
 
-from fastapi import UploadFile
+from fastapi import HTTPException, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse, Response
 
 from .config import settings
 
 
+class StagedFile(NamedTuple):
+    staging_key: str
+    size: int
+    sha256: str
+
+
+class SavedFile(NamedTuple):
+    name: str
+    url: str
+    size: int
+    sha256: str
+
+
+class Storage(Protocol):
+    # Uploads are staged first, then committed under their content hash once the blob row is locked
+    async def stage(self, file: UploadFile) -> StagedFile: ...
+
+    async def commit(self, staged: StagedFile) -> SavedFile: ...
+
+    async def discard(self, staged: StagedFile) -> None: ...
+
+    async def delete(self, name: str) -> None: ...
+
+    def url_for(self, name: str) -> str: ...
+
+    async def download_response(self, name: str, media_type: str, filename: str, headers: Dict[str, str]) -> Response: ...
+
+
+def copy_stream(source: BinaryIO, target: BinaryIO, max_size: int, chunk_size: int) -> tuple[int, str]:
+    # Fixed-size chunks keep memory flat; size and hash are computed on the fly
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+        digest.update(chunk)
+        target.write(chunk)
+    return size, digest.hexdigest()
+
+
+def content_disposition(filename: str, disposition: str = "inline") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
 class LocalStorage:
-    def __init__(self, base_dir: str):
+    def __init__(self, base_dir: str, max_size: int = settings.max_upload_bytes, chunk_size: int = settings.upload_chunk_size):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+
+    async def stage(self, file: UploadFile) -> StagedFile:
+        return await run_in_threadpool(self._stage, file)
+
+    async def commit(self, staged: StagedFile) -> SavedFile:
+        return await run_in_threadpool(self._commit, staged)
+
+    async def discard(self, staged: StagedFile) -> None:
+        await run_in_threadpool((self.base_dir / staged.staging_key).unlink, missing_ok=True)
+
+    async def delete(self, name: str) -> None:
+        await run_in_threadpool((self.base_dir / name).unlink, missing_ok=True)
+
+    def _stage(self, file: UploadFile) -> StagedFile:
+        staging_key = f"{uuid.uuid4().hex}.part"
+        partial = self.base_dir / staging_key
+        try:
+            with partial.open("wb") as buffer:
+                size, sha256 = copy_stream(file.file, buffer, self.max_size, self.chunk_size)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return StagedFile(staging_key, size, sha256)
+
+    def url_for(self, name: str) -> str:
+        return f"/uploads/{name}"
+
+    async def download_response(self, name: str, media_type: str, filename: str, headers: Dict[str, str]) -> Response:
+        path = self.base_dir / name
+        try:
+            stat_result = await run_in_threadpool(os.stat, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        if settings.accel_redirect_prefix:
+            # nginx serves the bytes (with Range support) from an internal location; no Python worker is held
+            accel_headers = {
+                **headers,
+                "X-Accel-Redirect": f"{settings.accel_redirect_prefix.rstrip('/')}/{quote(name)}",
+                "Content-Disposition": content_disposition(filename),
+            }
+            return Response(media_type=media_type, headers=accel_headers)
+        # FileResponse answers Range/If-Range itself and uses zero-copy pathsend when the server offers it
+        return FileResponse(
+            path,
+            media_type=media_type,
+            filename=filename,
+            headers=headers,
+            stat_result=stat_result,
+            content_disposition_type="inline",
+        )
+
+    def _commit(self, staged: StagedFile) -> SavedFile:
+        partial = self.base_dir / staged.staging_key
+        dest = self.base_dir / staged.sha256
+        if dest.exists():
+            partial.unlink(missing_ok=True)
+        else:
+            partial.replace(dest)
+        return SavedFile(staged.sha256, self.url_for(staged.sha256), staged.size, staged.sha256)
+
 
-    def save(self, file: UploadFile) -> Tuple[str, str, int]:
-        ext = Path(file.filename or "").suffix
-        safe_name = f"{uuid.uuid4().hex}{ext}"
-        dest = self.base_dir / safe_name
-        with dest.open("wb") as buffer:
-            buffer.write(file.file.read())
-        url = f"/uploads/{safe_name}"
-        size = dest.stat().st_size
-        return safe_name, url, size
+@lru_cache(maxsize=1)
+def get_s3_client():
+    # One client per process: boto3 clients are thread-safe and keep a pooled HTTP connection set
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=settings.s3_endpoint or None,
+        region_name=settings.s3_region or None,
+        aws_access_key_id=settings.s3_access_key,
+        aws_secret_access_key=settings.s3_secret_key,
+        config=Config(max_pool_connections=settings.s3_max_pool_connections, retries={"mode": "standard"}),
+    )
 
 
-# Placeholder for future S3-compatible backend
 class S3Storage:
-    def __init__(self):
-        raise NotImplementedError("S3 storage not configured")
+    def __init__(self, bucket: str | None = settings.s3_bucket, max_size: int = settings.max_upload_bytes, part_size: int = settings.s3_multipart_chunk_size):
+        if not bucket:
+            raise RuntimeError("S3 storage requires S3_BUCKET")
+        self.bucket = bucket
+        self.max_size = max_size
+        self.part_size = part_size
+        self.client = get_s3_client()
+
+    async def stage(self, file: UploadFile) -> StagedFile:
+        return await run_in_threadpool(self._stage, file)
+
+    async def commit(self, staged: StagedFile) -> SavedFile:
+        return await run_in_threadpool(self._commit, staged)
+
+    async def discard(self, staged: StagedFile) -> None:
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=staged.staging_key)
+
+    async def delete(self, name: str) -> None:
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=name)
+
+    def _stage(self, file: UploadFile) -> StagedFile:
+        key = f"staging/{uuid.uuid4().hex}"
+        content_type = file.content_type or "application/octet-stream"
+        digest = hashlib.sha256()
+        first = file.file.read(self.part_size)
+        if len(first) < self.part_size:
+            # Fits in one part: a single PUT is cheaper than a multipart round trip
+            if len(first) > self.max_size:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+            digest.update(first)
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=first, ContentType=content_type)
+            return StagedFile(key, len(first), digest.hexdigest())
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type)["UploadId"]
+        parts = []
+        size = 0
+        try:
+            chunk = first
+            while chunk:
+                size += len(chunk)
+                if size > self.max_size:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+                digest.update(chunk)
+                part_number = len(parts) + 1
+                etag = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=chunk)["ETag"]
+                parts.append({"ETag": etag, "PartNumber": part_number})
+                chunk = file.file.read(self.part_size)
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return StagedFile(key, size, digest.hexdigest())
+
+    def _commit(self, staged: StagedFile) -> SavedFile:
+        key = staged.sha256
+        if not self._exists(key):
+            self.client.copy_object(Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": staged.staging_key})
+        self.client.delete_object(Bucket=self.bucket, Key=staged.staging_key)
+        return SavedFile(key, self.url_for(key), staged.size, staged.sha256)
+
+    def url_for(self, name: str) -> str:
+        return f"s3://{self.bucket}/{name}"
+
+    async def download_response(self, name: str, media_type: str, filename: str, headers: Dict[str, str]) -> Response:
+        # The bucket serves the bytes (Range included); the API only authorizes and signs
+        url = self.presigned_url(
+            name,
+            ResponseContentType=media_type,
+            ResponseContentDisposition=content_disposition(filename),
+        )
+        # The signature expires after s3_presign_expires, so the redirect itself must not outlive it in any cache;
+        # the long-lived caching headers only belong on responses that carry the bytes
+        redirect_headers = {name: value for name, value in headers.items() if name not in ("Cache-Control", "ETag")}
+        redirect_headers["Cache-Control"] = "no-store"
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=redirect_headers)
+
+    def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
 
-    def save(self, file: UploadFile):
-        raise NotImplementedError
+    def presigned_url(self, key: str, expires_in: int = settings.s3_presign_expires, **params: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key, **params}, ExpiresIn=expires_in
+        )
 
 
-def get_storage():
-    if settings.file_storage_backend == "local":
-        return LocalStorage(settings.upload_dir)
+STORAGE_BACKENDS: Dict[str, Callable[[], Storage]] = {}
+
+
+def register_storage(name: str):
+    def decorator(factory: Callable[[], Storage]) -> Callable[[], Storage]:
+        STORAGE_BACKENDS[name] = factory
+        return factory
+
+    return decorator
+
+
+@register_storage("local")
+def _local_storage() -> Storage:
     return LocalStorage(settings.upload_dir)
+
+
+@register_storage("s3")
+def _s3_storage() -> Storage:
+    return S3Storage()
+
+
+def create_storage(backend: str = settings.file_storage_backend) -> Storage:
+    factory = STORAGE_BACKENDS.get(backend)
+    if factory is None:
+        raise RuntimeError(f"Unknown file storage backend: {backend}")
+    return factory()
+
+
+def get_storage(request: Request) -> Storage:
+    # Built once in the app lifespan; see main.lifespan
+    return request.app.state.storage
@@ -0,0 +1,86 @@
+﻿# Ticket list serialization benchmark: the previous ORM + response_model path against the Core rows + orjson path.
+# Run from apps/api against a populated database: python -m scripts.bench_ticket_list --rows 1000
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import raiseload
+
+from app import schemas
+from app.db import AsyncSessionLocal, async_engine
+from app.models import Ticket
+from app.responses import FastJSONResponse
+from app.routers.tickets import TICKET_SUMMARY_COLUMNS
+
+PAGE_FIELD = create_model_field(name="Response", type_=schemas.TicketPage, mode="serialization")
+PAGE_ADAPTER = TypeAdapter(schemas.TicketPage)
+
+
+async def best_of(fn, repeat: int, rounds: int = 5) -> float:
+    await fn()
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await fn()
+        times.append((time.perf_counter() - started) / repeat)
+    return min(times)
+
+
+async def main(rows: int, repeat: int) -> None:
+    async with AsyncSessionLocal() as db:
+        orm_query = select(Ticket).options(raiseload(Ticket.comments), raiseload(Ticket.attachments)).order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(rows)
+        core_query = select(*TICKET_SUMMARY_COLUMNS).order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(rows)
+
+        async def orm_fetch():
+            tickets = (await db.scalars(orm_query)).all()
+            # A request starts with an empty identity map
+            db.expunge_all()
+            return tickets
+
+        async def core_fetch():
+            return (await db.execute(core_query)).mappings().all()
+
+        async def previous(tickets=None):
+            # response_model validation with from_attributes, then JSONResponse's json.dumps
+            content = await serialize_response(field=PAGE_FIELD, response_content={"items": tickets if tickets is not None else await orm_fetch(), "next_cursor": None}, is_coroutine=True)
+            return JSONResponse(content).body
+
+        async def type_adapter(records=None):
+            records = records if records is not None else await core_fetch()
+            return PAGE_ADAPTER.dump_json(PAGE_ADAPTER.validate_python({"items": records, "next_cursor": None}))
+
+        async def current(records=None):
+            records = records if records is not None else await core_fetch()
+            return FastJSONResponse({"items": [{**record, "match": None} for record in records], "next_cursor": None}).body
+
+        tickets = await orm_fetch()
+        records = await core_fetch()
+        expected = json.loads(await previous(tickets))
+        print(f"{len(records)} rows, best of 5 x {repeat}")
+        print(f"{'path':34s} {'fetch ms':>9s} {'encode ms':>10s} {'total ms':>9s} {'rows/s':>9s}  same output")
+        for name, fetch, encode, fetched in (
+            ("ORM + response_model (previous)", orm_fetch, previous, tickets),
+            ("Core + TypeAdapter", core_fetch, type_adapter, records),
+            ("Core + orjson (current)", core_fetch, current, records),
+        ):
+            fetch_s = await best_of(fetch, repeat)
+            encode_s = await best_of(lambda: encode(fetched), repeat)
+            total_s = await best_of(encode, repeat)
+            same = json.loads(await encode(fetched)) == expected
+            print(f"{name:34s} {fetch_s * 1000:9.1f} {encode_s * 1000:10.1f} {total_s * 1000:9.1f} {len(records) / total_s:9.0f}  {same}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,30 @@
+﻿import pytest
+
+from app import middleware
+
+LIST_ENDPOINTS = ["/tickets", "/admin/tickets"]
+
+
+@pytest.fixture
+def query_counts(monkeypatch):
+    # check_query_budget sees every request's final statement count
+    counts = []
+    monkeypatch.setattr(middleware, "check_query_budget", lambda stats: counts.append(stats.queries))
+    return counts
+
+
+@pytest.mark.parametrize("path", LIST_ENDPOINTS)
+def test_list_query_count_does_not_grow_with_page_size(client, admin_headers, store_id, query_counts, path):
+    for limit in (1, 50):
+        response = client.get(path, params={"store_id": store_id, "limit": limit}, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        assert len(response.json()["items"]) == limit
+    assert query_counts[0] == query_counts[1]
+
+
+@pytest.mark.parametrize("path", LIST_ENDPOINTS)
+def test_list_next_page_query_count(client, admin_headers, store_id, query_counts, path):
+    first = client.get(path, params={"store_id": store_id, "limit": 50}, headers=admin_headers).json()
+    second = client.get(path, params={"store_id": store_id, "limit": 50, "cursor": first["next_cursor"]}, headers=admin_headers)
+    assert second.status_code == 200, second.text
+    assert query_counts[0] == query_counts[1]